@@ -1,17 +1,9 @@
 from flask import Flask, request, Response
 from flask_cors import CORS
-from firebase_admin import credentials, initialize_app
-from config import GOOGLE_SERVICE_ACCOUNT
-import json
+from config import PREWARM_CLIENTS
+from services.clients import prewarm
 import os
 
-if GOOGLE_SERVICE_ACCOUNT:
-    cred = credentials.Certificate(json.loads(GOOGLE_SERVICE_ACCOUNT))
-else:
-    print("Using key.json for credentials.")
-    cred = credentials.Certificate("api/key.json")
-default_app = initialize_app(cred)
-
 
 def create_app():
     app = Flask(__name__)
@@ -47,6 +39,12 @@ def create_app():
 
     from .notesAPI import notesAPI
     from api.aiAPI import aiAPI  # Absolute import
+    from api.metricsAPI import metricsAPI
+    from api.auth import start_certificate_refresh
+
+    start_certificate_refresh()
+    if PREWARM_CLIENTS:
+        prewarm()
 
     # Must also wrap blueprints in CORS
     CORS(notesAPI, **args)
@@ -54,4 +52,5 @@ def create_app():
 
     app.register_blueprint(notesAPI, url_prefix='/notes')
     app.register_blueprint(aiAPI, url_prefix='/ai')
+    app.register_blueprint(metricsAPI, url_prefix='/metrics')
     return app
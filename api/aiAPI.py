@@ -1,22 +1,16 @@
 from flask import Blueprint, request, jsonify
-import openai
-import os
-import re
-import json
-from dotenv import load_dotenv
-from api.notesAPI import note_ref
-from services.llm_service import query_llm
-
-# Load environment variables from .env
-load_dotenv()
+from services.clients import get_note_ref
+from services.llm_service import query_llm, stream_llm
+from services.summarizer import stream_summary
+from services.artifacts import get_artifact, load_artifact, save_artifact, content_hash
+from services.singleflight import single_flight, flight_key, normalize_query
+from services import answer_cache
+from api.streaming import wants_stream, sse_response
+from services.metrics import span
 
 # Create Blueprint
 aiAPI = Blueprint('aiAPI', __name__, url_prefix='/ai')
 
-# Set OpenAI API Key
-openai_api_key = os.getenv("OPENAI_API_KEY")
-client = openai.OpenAI(api_key=openai_api_key)
-
 @aiAPI.route('/summarize', methods=['POST'])
 def summary():
     try:
@@ -25,15 +19,26 @@ def summary():
         if not data or not data.get("id"):
             return jsonify({"success": False, "error": "id is required"}), 400
 
-        note = note_ref.document(data["id"]).get()
+        with span("firestore_read"):
+            note = get_note_ref().document(data["id"]).get()
         if not note.exists:
             return jsonify({"success": False, "error": "Note not found"}), 404
         
         note_data = note.to_dict()
 
-        content = "\n".join([block["value"] for block in note_data.get("content", []) if block.get("value", "").strip()])
+        if wants_stream():
+            cached = load_artifact(data["id"], note_data, "summary")
+            if cached is not None:
+                return sse_response(iter([cached]))
+            return sse_response(
+                stream_summary(note_data),
+                on_done=lambda text: save_artifact(data["id"], note_data, "summary", text),
+            )
 
-        response = query_llm("Summarize the note content above.", content, "")
+        # Reuses the stored summary if the content hasn't changed, and shares
+        # one generation between concurrent requests
+        key = flight_key("summarize", (data["id"], content_hash(note_data)))
+        response = single_flight(key, lambda: get_artifact(data["id"], note_data, "summary"))
 
         if response is None:
             return jsonify({"success": False, "error": "Error generating summary"}), 500
@@ -42,8 +47,6 @@ def summary():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
-REMOVE_FORMATTING = re.compile(r"(```json)*([^`]+)*(```)*")
-
 @aiAPI.route('/flashcards', methods=['POST'])
 def flashcards():
     try:
@@ -52,24 +55,17 @@ def flashcards():
         if not data or not data.get("id"):
             return jsonify({"success": False, "error": "id is required"}), 400
 
-        note = note_ref.document(data["id"]).get()
+        with span("firestore_read"):
+            note = get_note_ref().document(data["id"]).get()
         if not note.exists:
             return jsonify({"success": False, "error": "Note not found"}), 404
         
         note_data = note.to_dict()
 
-        content = "\n".join([block["value"] for block in note_data.get("content", []) if block.get("value", "").strip()])
-
-        response = query_llm("Create flashcards from the note content above in a JSON list using form {\"term\": \"A\", \"definition\": \"The definition of A\" }. Do not return nothing else.", content, "")
-
-        if response is None:
-            return jsonify({"success": False, "error": "Error generating flashcards"}), 500
-
-        print(response)
-
-        # replace backticks, newlines, and extra spaces
-        response = REMOVE_FORMATTING.sub(r'\2', response).strip()
-        js = json.loads(response)
+        # Reuses the stored flashcards if the content hasn't changed, and shares
+        # one generation between concurrent requests
+        key = flight_key("flashcards", (data["id"], content_hash(note_data)))
+        js = single_flight(key, lambda: get_artifact(data["id"], note_data, "flashcards"))
 
         return jsonify({"success": True, "data": js}), 200
     except Exception as e:
@@ -85,7 +81,24 @@ def chat():
             print("Error: No message received")
             return jsonify({"success": False, "error": "Message is required"}), 400
         
-        reply = query_llm(user_message, "", "")
+        # Chat has no note or caller to scope answers to, and similar messages may
+        # differ in just the name or number that changes the answer. So answers
+        # are only reused for the same message, ignoring case and whitespace.
+        scope = ("chat", None, normalize_query(user_message))
+
+        if wants_stream():
+            cached, vector = answer_cache.lookup(scope, user_message)
+            if cached is not None:
+                return sse_response(iter([cached]))
+            return sse_response(
+                stream_llm(user_message, "", ""),
+                on_done=lambda text: answer_cache.store(scope, vector, text),
+            )
+
+        reply = single_flight(
+            flight_key("chat", None, user_message),
+            lambda: answer_cache.cached_answer(scope, user_message, lambda: query_llm(user_message, "", "")),
+        )
         
         if reply is None:
             return jsonify({"success": False, "error": "Error generating response"}), 500
@@ -0,0 +1,83 @@
+from flask import request, jsonify, g
+from firebase_admin import auth
+from functools import wraps
+from collections import OrderedDict
+from config import AUTH_CACHE_SIZE, AUTH_CERT_REFRESH_SECONDS
+from services.clients import get_firebase_app
+from services.metrics import span
+import threading
+import time
+
+_tokens = OrderedDict()  # ID token -> decoded token, until the token's exp
+_tokens_lock = threading.Lock()
+_refresher = None
+
+
+def verify_token(id_token):
+    """Verifies a Firebase ID token, reusing the result until the token expires"""
+    now = time.time()
+    with _tokens_lock:
+        decoded = _tokens.get(id_token)
+        if decoded is not None:
+            if decoded["exp"] > now:
+                _tokens.move_to_end(id_token)
+                return decoded
+            del _tokens[id_token]
+
+    get_firebase_app()
+    decoded = auth.verify_id_token(id_token)
+
+    with _tokens_lock:
+        _tokens[id_token] = decoded
+        while len(_tokens) > AUTH_CACHE_SIZE:
+            _tokens.popitem(last=False)
+    return decoded
+
+
+def require_auth(view):
+    """Verifies the request's bearer token and stores the caller's uid on flask.g"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        auth_token = request.headers.get('Authorization')
+        if not auth_token:
+            return jsonify({"success": False, "error": "Missing Authorization header"}), 401
+
+        # Remove Bearer
+        auth_token = auth_token.split(' ').pop()
+        try:
+            with span("auth"):
+                decoded_token = verify_token(auth_token)
+        except (ValueError, auth.InvalidIdTokenError) as e:
+            return jsonify({"success": False, "error": str(e)}), 401
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 500
+
+        g.uid = decoded_token['uid']
+        g.token = decoded_token
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def _refresh_certificates():
+    # firebase_admin keeps Google's signing certificates in an HTTP cache, but only
+    # refetches them once a request finds them expired. Forcing a fetch every
+    # interval keeps that cache fresh, so requests never wait on the download.
+    from firebase_admin import _token_gen
+
+    while True:
+        try:
+            get_firebase_app()
+            verifier = auth._get_client(None)._token_verifier
+            verifier.request(url=_token_gen.ID_TOKEN_CERT_URI, headers={"Cache-Control": "no-cache"})
+        except Exception as e:
+            print(f"Error refreshing signing certificates: {e}")
+        time.sleep(AUTH_CERT_REFRESH_SECONDS)
+
+
+def start_certificate_refresh():
+    """Starts refreshing Google's signing certificates in the background"""
+    global _refresher
+    if _refresher is None and AUTH_CERT_REFRESH_SECONDS > 0:
+        _refresher = threading.Thread(target=_refresh_certificates, name="cert-refresh", daemon=True)
+        _refresher.start()
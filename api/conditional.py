@@ -0,0 +1,27 @@
+from flask import request, make_response
+import hashlib
+import json
+
+
+def etag_for(*parts):
+    """Builds a weak ETag from JSON-serializable parts, e.g. a note's updatedAt"""
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def is_fresh(etag):
+    """Whether the client's If-None-Match already names this ETag"""
+    return request.if_none_match.contains_weak(etag)
+
+
+def with_etag(response, etag):
+    """Tags a response, making browsers revalidate it on every use"""
+    response.set_etag(etag, weak=True)
+    # Responses depend on who's asking
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Authorization")
+    return response
+
+
+def not_modified(etag):
+    return with_etag(make_response("", 304), etag)
@@ -0,0 +1,58 @@
+from flask import Blueprint, Response, g, request
+from services.clients import existing_client
+from services.indexing_queue import queue_stats
+from services import answer_cache
+from services.metrics import observe, render, server_timing
+import time
+
+metricsAPI = Blueprint('metricsAPI', __name__, url_prefix='/metrics')
+
+
+@metricsAPI.before_app_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@metricsAPI.after_app_request
+def record_request(response):
+    start = g.get("request_start")
+    if start is None:
+        return response
+
+    duration = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    if route != "/metrics":
+        observe(
+            "noteflow_request_seconds",
+            duration,
+            help="Time to handle a request, up to the start of a streamed body",
+            method=request.method,
+            route=route,
+            status=response.status_code,
+        )
+
+    timing = server_timing()
+    total = f"total;dur={duration * 1000:.1f}"
+    response.headers["Server-Timing"] = f"{timing}, {total}" if timing else total
+    return response
+
+
+def _gauges():
+    gauges = []
+    for state, count in queue_stats().items():
+        gauges.append(("noteflow_index_queue_notes", "Notes waiting for or being indexed", {"state": state}, count))
+
+    for key, value in answer_cache.stats().items():
+        gauges.append((f"noteflow_answer_cache_{key}", "Semantic answer cache statistics", {}, value))
+
+    # Don't create the embeddings client just to report on it
+    embeddings = existing_client("embeddings")
+    if embeddings is not None and hasattr(embeddings, "stats"):
+        for key, value in embeddings.stats().items():
+            gauges.append((f"noteflow_embedding_cache_{key}", "Embedding cache statistics", {}, value))
+    return gauges
+
+
+@metricsAPI.route('', methods=['GET'])
+def metrics():
+    return Response(render(_gauges()), mimetype="text/plain; version=0.0.4")
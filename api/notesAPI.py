@@ -1,76 +1,113 @@
-from flask import Blueprint, request, jsonify
-from firebase_admin import firestore, auth
-from google.cloud.firestore_v1.base_query import FieldFilter, Or
+from flask import Blueprint, request, jsonify, g
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
 from uuid import uuid4
-from services.rag import rag_store, rag_remove, rag_query
+from services.rag import rag_query, rag_query_stream, rag_query_all, rag_query_all_stream
+from services.vectorstore_service import INDEX_FIELDS
+from api.streaming import wants_stream, sse_response
+from services.indexing_queue import index_note, remove_note, index_status
+from services.clients import get_note_ref, get_firestore
+from services.note_patch import apply_ops, PatchError, PATCHABLE_FIELDS
+from services.users import resolve_users
+from services.access import access_list
+from services import search_index, answer_cache
+from services.search_index import LIST_FIELDS
+from services.singleflight import single_flight, flight_key
+from services.metrics import span
+from api.auth import require_auth
+from api.conditional import etag_for, is_fresh, with_etag, not_modified
 from datetime import datetime
 
-db = firestore.client()
-note_ref = db.collection('notes')
 
 notesAPI = Blueprint('notesAPI', __name__, url_prefix='/notes')
 
+# Fields needed to check access and freshness without fetching the whole note
+ACCESS_FIELDS = ["owner", "permissions", "updatedAt", "revision", "indexedRevision"]
+
 def to_timestamp(firestoreTimestamp):
     return firestoreTimestamp.isoformat()
 
 def to_time(timestamp):
     return datetime.fromisoformat(timestamp)
 
+def can_edit(note, uid):
+    """Whether uid may edit the note snapshot"""
+    return note.get("owner") == uid or note.get('permissions.global') == "edit" or uid in note.get('permissions.edit')
+
+def strip_index_fields(r):
+    """Drops the fields only the indexer sets, see save_note_vectors"""
+    for field in INDEX_FIELDS:
+        r.pop(field, None)
+
+def note_etag(uid, note, status):
+    # Sharing doesn't change updatedAt, so permissions are part of the ETag too
+    data = note.to_dict()
+    return etag_for(uid, data.get("updatedAt"), data.get("revision"), data.get("permissions"), status)
+
 @notesAPI.route('', methods=['GET'])
+@require_auth
 def get_notes():
+    """Lists the caller's notes by last update, or with ?q=, ranks them by relevance.
+
+    Searches use services.search_index, an index kept in each process. Notes
+    saved or shared through other instances can take up to
+    SEARCH_INDEX_SYNC_SECONDS to be found. Deleted notes and revoked shares are
+    left out as soon as they'd be returned, but until then may still count
+    towards the total, so a page can come back short.
+    """
     try:
-        auth_token = request.headers.get('Authorization')
         query = request.args.get('q')
         cursor = request.args.get('cursor') or None
         sort_order = request.args.get('sort', 'asc')
         limit = 10
-
-        if not auth_token:
-            return jsonify({"success": False, "error": "Missing Authorization header"}), 401
+        uid = g.uid
         
-        # Remove Bearer
-        auth_token = auth_token.split(' ').pop()
+        if query:
+            # Full-text search, ranked by relevance. The cursor is an offset here.
+            if cursor and not cursor.isdigit():
+                return jsonify({"success": False, "error": "Invalid cursor"}), 400
+            offset = int(cursor or 0)
+            with span("search"):
+                notes, total = search_index.search(query, uid, limit, offset)
+            with span("firestore_read"):
+                notes = search_index.check_access(notes, uid)
+            newCursor = str(offset + limit) if offset + limit < total else None
+        else:
+            notes, newCursor = list_notes(uid, cursor, sort_order, limit)
 
-        # Get uid from ID token
-        decoded_token = auth.verify_id_token(auth_token)
-        uid = decoded_token['uid']
+        etag = etag_for(uid, notes, newCursor)
+        if is_fresh(etag):
+            return not_modified(etag)
         
-        # Determine Firestore sort direction
-        direction = firestore.Query.ASCENDING if sort_order == 'asc' else firestore.Query.DESCENDING
-
-        notes = note_ref.where(
-            filter=Or(
-                [
-                    FieldFilter("owner", "==", uid),
-                    FieldFilter("permissions.edit", "array_contains", uid),
-                    FieldFilter("permissions.view", "array_contains", uid),
-                ]
-            )
-        )
+        return with_etag(jsonify({"success": True, "results": notes, "cursor": newCursor}), etag), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
 
-        if query:
-            # Need to do this to bound the search, since Firebase doesn't support
-            # in text searching
-            endcode = query[:-1] + chr(ord(query[-1]) + 1)
-            notes = notes.where("title", ">=", query).where("title", "<", endcode)
+def accessible_notes(uid):
+    """Every note uid can access, with the fields cross-note retrieval needs"""
+    notes = get_note_ref().where(filter=FieldFilter("access", "array_contains", uid))
+    with span("firestore_read"):
+        return [{**note.to_dict(), "id": note.id} for note in notes.select(["title", "revision"] + INDEX_FIELDS).stream()]
 
-        if cursor:
-            notes = notes.start_after({"updatedAt": to_time(cursor)})
+def list_notes(uid, cursor, sort_order, limit):
+    """Lists the notes uid can access by last update, returning (notes, next cursor)"""
+    # Determine Firestore sort direction
+    direction = firestore.Query.ASCENDING if sort_order == 'asc' else firestore.Query.DESCENDING
 
-        notes = notes.order_by("updatedAt", direction)
+    # access holds the owner, editors and viewers, see services.access
+    notes = get_note_ref().where(filter=FieldFilter("access", "array_contains", uid))
 
-        notes = notes.limit(limit).stream()
-        
-        notes = [note.to_dict() for note in notes]
-        # To save on performance, don't return content
-        for note in notes:
-            note.pop("content", None)
+    if cursor:
+        notes = notes.start_after({"updatedAt": to_time(cursor)})
 
-        newCursor = to_timestamp(notes[-1]['updatedAt']) if len(notes) == limit else None
-        
-        return jsonify({"success": True, "results": notes, "cursor": newCursor}), 200
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+    notes = notes.order_by("updatedAt", direction)
+
+    # To save on performance, don't fetch content
+    with span("firestore_read"):
+        notes = [note.to_dict() for note in notes.select(LIST_FIELDS).limit(limit).stream()]
+
+    newCursor = to_timestamp(notes[-1]['updatedAt']) if len(notes) == limit else None
+    return notes, newCursor
     
 @notesAPI.route('', methods=['POST'])
 def add():
@@ -80,36 +117,46 @@ def add():
         r['id'] = id
         r['createdAt'] = firestore.SERVER_TIMESTAMP
         r['updatedAt'] = firestore.SERVER_TIMESTAMP
-        note_ref.document(id).set(r)
+        r['revision'] = 1
+        r['access'] = access_list(r)
+        strip_index_fields(r)
+        with span("firestore_write"):
+            get_note_ref().document(id).set(r)
 
-        # Also store vectors in Pinecone
-        rag_store(r)
+        # Also store vectors in Pinecone, in the background
+        index_note(r)
+        search_index.index_note(r)
 
         return jsonify({"success": True, "id": id, "message": f"Note added/updated successfully"}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 @notesAPI.route('/<id>', methods=['PUT'])
+@require_auth
 def put(id):
     try:
         r = request.get_json()
-        auth_token = request.headers.get('Authorization')
-        if not auth_token:
-            return jsonify({"success": False, "error": "Missing Authorization header"}), 401
         if r['id'] != id:
             return jsonify({"success": False, "error": "ID mismatch"}), 400
         
-        auth_token = auth_token.split(' ').pop()
-        decoded_token = auth.verify_id_token(auth_token)
-        sender_uid = decoded_token['uid']
+        sender_uid = g.uid
 
-        note = note_ref.document(id).get()
+        with span("firestore_read"):
+            note = get_note_ref().document(id).get()
 
         if note.exists:
-            if note.get("owner") == sender_uid or note.get('permissions.global') == "edit" or sender_uid in note.get(f'permissions.edit'):
+            if can_edit(note, sender_uid):
                 r['updatedAt'] = firestore.SERVER_TIMESTAMP
-                note_ref.document(id).set(r)
-                rag_store(r)
+                # Versions the note's vectors, see save_note_vectors
+                r['revision'] = note.to_dict().get('revision', 0) + 1
+                r['access'] = access_list(r)
+                strip_index_fields(r)
+                with span("firestore_write"):
+                    # Merging the sent fields leaves the indexer's fields as they are
+                    get_note_ref().document(id).set(r, merge=list(r))
+                index_note(r)
+                search_index.index_note(r)
+                answer_cache.invalidate(id)
                 
                 return jsonify({"success": True, "data": note.to_dict()}), 200
 
@@ -119,22 +166,101 @@ def put(id):
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@notesAPI.route('/<id>', methods=['PATCH'])
+@require_auth
+def patch(id):
+    """Applies block operations to a note, see services.note_patch.apply_ops.
+
+    The body is {"baseRevision": revision the ops were made against, "ops": [...],
+    "set": {"title": ..., "description": ...}}. If the note has moved past
+    baseRevision, nothing is applied and the response is a 409 with the
+    current revision.
+    """
+    try:
+        r = request.get_json()
+        ops = r.get("ops", [])
+        fields = r.get("set", {})
+        base_revision = r.get("baseRevision")
+        if not isinstance(ops, list) or not isinstance(fields, dict) or base_revision is None:
+            return jsonify({"success": False, "error": "Bad request format"}), 400
+        if not set(fields) <= PATCHABLE_FIELDS:
+            return jsonify({"success": False, "error": f"Only {', '.join(sorted(PATCHABLE_FIELDS))} can be set"}), 400
+
+        sender_uid = g.uid
+        ref = get_note_ref().document(id)
+
+        @firestore.transactional
+        def apply(transaction):
+            note = ref.get(transaction=transaction)
+            if not note.exists:
+                return None, (jsonify({"success": False, "error": f"Note not found"}), 404)
+            if not can_edit(note, sender_uid):
+                return None, (jsonify({"success": False, "error": f"No permission"}), 200)
+
+            note_data = note.to_dict()
+            revision = note_data.get('revision', 0)
+            if revision != base_revision:
+                return None, (jsonify({"success": False, "error": "Note has changed", "revision": revision}), 409)
+
+            content, changes, text_changed = apply_ops(note_data.get("content", []), ops)
+            update = {
+                **fields,
+                "content": content,
+                "updatedAt": firestore.SERVER_TIMESTAMP,
+                # Versions the note's vectors, see save_note_vectors
+                "revision": revision + 1,
+            }
+            if not text_changed and note_data.get("indexedRevision") == revision:
+                # The vectors of the previous revision are also this one's
+                update["indexedRevision"] = revision + 1
+            transaction.update(ref, update)
+            note_data.update(update)
+            return (note_data, changes, text_changed), None
+
+        with span("firestore_write"):
+            result, error = apply(get_firestore().transaction())
+        if error is not None:
+            return error
+
+        note_data, changes, text_changed = result
+        note_data.setdefault("id", id)
+        search_index.index_note(note_data)
+        answer_cache.invalidate(id)
+        # Style-only edits leave the vectors as they are. Otherwise only chunks
+        # around the changed blocks get new IDs, so only those are re-embedded.
+        if text_changed:
+            index_note(note_data)
+
+        return jsonify({"success": True, "revision": note_data["revision"], "changed": changes}), 200
+    except PatchError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @notesAPI.route('/<id>', methods=['GET'])
+@require_auth
 def get(id):
     try:
-        auth_token = request.headers.get('Authorization')
-        if not auth_token:
-            return jsonify({"success": False, "error": "Missing Authorization header"}), 401
-        
-        auth_token = auth_token.split(' ').pop()
-        decoded_token = auth.verify_id_token(auth_token)
-        sender_uid = decoded_token['uid']
+        sender_uid = g.uid
+        conditional = bool(request.if_none_match)
 
-        note = note_ref.document(id).get()
+        with span("firestore_read"):
+            # A revalidating client only needs the fields its ETag depends on
+            note = get_note_ref().document(id).get(ACCESS_FIELDS if conditional else None)
 
         if note.exists:
             if note.get("owner") == sender_uid or note.get('permissions.global') is not None or sender_uid in note.get(f'permissions.view') or sender_uid in note.get(f'permissions.edit'):
-                return jsonify({"success": True, "data": note.to_dict()}), 200
+                status = index_status({**note.to_dict(), "id": id})
+                etag = note_etag(sender_uid, note, status)
+                if is_fresh(etag):
+                    return not_modified(etag)
+                if conditional:
+                    with span("firestore_read"):
+                        note = get_note_ref().document(id).get()
+                    # The note may have changed since the first read
+                    etag = note_etag(sender_uid, note, status)
+
+                return with_etag(jsonify({"success": True, "data": note.to_dict(), "indexStatus": status}), etag), 200
 
             return jsonify({"success": False, "error": f"No permission"}), 200
         else:
@@ -146,23 +272,73 @@ def get(id):
 @notesAPI.route('/<id>', methods=['DELETE'])
 def remove(id):
     try:
-        note_ref.document(id).delete()
-        # Also remove vectors from Pinecone
-        rag_remove(id)
+        with span("firestore_write"):
+            get_note_ref().document(id).delete()
+        # Also remove vectors from Pinecone and generated artifacts, in the background
+        remove_note(id)
+        search_index.remove_note(id)
+        answer_cache.invalidate(id)
 
         return jsonify({"success": True, "message": f"Note removed successfully"}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@notesAPI.route('/search', methods=['GET'])
+@require_auth
+def search_all():
+    """Answers a question from all the notes the caller can access, citing the notes used"""
+    try:
+        query = request.args.get('q')
+        if not query:
+            return jsonify({"success": False, "error": "q is required"}), 400
+
+        # Firestore decides access, so revoked shares apply on every instance at once
+        notes = accessible_notes(g.uid)
+
+        if wants_stream():
+            tokens, sources = rag_query_all_stream(query, notes)
+            return sse_response(tokens, done_data={"sources": sources})
+
+        # Identical concurrent searches over the same indexed revisions share one LLM call
+        revisions = tuple((note["id"], note.get("indexedRevision")) for note in notes)
+        key = flight_key("search_all", (g.uid, revisions), query)
+        answer, sources = single_flight(key, lambda: rag_query_all(query, notes))
+        return jsonify({"success": True, "data": answer, "sources": sources}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @notesAPI.route('/<id>/search', methods=['GET'])
 def search(id):
     try:
         query = request.args.get('q')
-        note = note_ref.document(id).get()
+        with span("firestore_read"):
+            note = get_note_ref().document(id).get()
 
         if note.exists:
-            context = rag_query(query, id)
+            note_data = note.to_dict()
+            note_data.setdefault("id", id)
+            # Answers are reused for similar questions about the same indexed
+            # revision, since that's what retrieval reads until the new one is committed
+            scope = ("search", id, note_data.get("indexedRevision"))
+
+            if wants_stream():
+                if not query:
+                    return jsonify({"success": False, "error": "q is required"}), 400
+                cached, vector = answer_cache.lookup(scope, query)
+                if cached is not None:
+                    return sse_response(iter([cached]))
+                return sse_response(
+                    rag_query_stream(query, note_data),
+                    on_done=lambda text: answer_cache.store(scope, vector, text),
+                )
+
+            if not query:
+                return jsonify({"success": True, "data": None}), 200
+
+            # Identical concurrent searches share one LLM call
+            key = flight_key("search", scope[1:], query)
+            context = single_flight(key, lambda: answer_cache.cached_answer(scope, query, lambda: rag_query(query, note_data)))
             return jsonify({"success": True, "data": context}), 200
         else:
             return jsonify({"success": False, "error": f"Note not found"}), 404
@@ -170,15 +346,10 @@ def search(id):
         return jsonify({"success": False, "error": str(e)}), 500
 
 @notesAPI.route('/<id>/share', methods=['POST'])
+@require_auth
 def share(id):
     try:
-        auth_token = request.headers.get('Authorization')
-        if not auth_token:
-            return jsonify({"success": False, "error": "Missing Authorization header"}), 401
-        
-        auth_token = auth_token.split(' ').pop()
-        decoded_token = auth.verify_id_token(auth_token)
-        sender_uid = decoded_token['uid']
+        sender_uid = g.uid
 
         # Parse request JSON
         r = request.get_json()
@@ -189,7 +360,8 @@ def share(id):
             return jsonify({"success": False, "error": "Bad request format"}), 400
         
         # Fetch the note
-        note_doc = note_ref.document(id).get()
+        with span("firestore_read"):
+            note_doc = get_note_ref().document(id).get()
         if not note_doc.exists:
             return jsonify({"success": False, "error": "Note not found"}), 404
 
@@ -209,31 +381,31 @@ def share(id):
         successes = []
         failures = []
 
+        # Look up every recipient at once, by email or uid
+        with span("auth_lookup"):
+            recipients = resolve_users([
+                email for email, permission in user_permissions.items() if permission in ["view", "edit"]
+            ])
+
         for email, permission in user_permissions.items():
-            if permission not in ["view", "edit"]:
+            if permission not in ["view", "edit"] or email not in recipients:
                 failures.append(email)
                 continue
-            try:
-                if "@" not in email:
-                    recipient_user = auth.get_user(email)
-                else:
-                    recipient_user = auth.get_user_by_email(email)
-                recipient_uid = recipient_user.uid
-                recipient_name = recipient_user.display_name
-                permissions[permission].append(recipient_uid)
-                permissions['names'][recipient_uid] = recipient_name
-                successes.append(email)
-            except auth.UserNotFoundError:
-                failures.append(email)
+            recipient_uid, recipient_name = recipients[email]
+            permissions[permission].append(recipient_uid)
+            permissions['names'][recipient_uid] = recipient_name
+            successes.append(email)
             
         permissions["global"] = global_permissions
 
-        note_ref.document(id).update({"permissions": permissions})
+        access = access_list({"owner": owner, "permissions": permissions})
+        with span("firestore_write"):
+            # accessUpdatedAt lets other instances' search indexes catch up with the share
+            get_note_ref().document(id).update({"permissions": permissions, "access": access, "accessUpdatedAt": firestore.SERVER_TIMESTAMP})
+        search_index.update_access(id, permissions, access)
 
         return jsonify({"success": True, "successes": successes, "failures": failures, "permissions": permissions}), 200
 
-    except auth.UserNotFoundError:
-        return jsonify({"success": False, "error": "User with this email not found" + recipient_user.uid}), 404
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
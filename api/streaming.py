@@ -0,0 +1,47 @@
+from flask import Response, request, stream_with_context
+import json
+
+
+def wants_stream():
+    """Whether the client asked for a Server-Sent Events response"""
+    return request.args.get("stream") == "true" or "text/event-stream" in request.headers.get("Accept", "")
+
+
+def sse_event(data, event=None):
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+def sse_response(tokens, on_done=None, done_data=None):
+    """Streams text from a generator as Server-Sent Events.
+
+    Each piece of text is sent as {"token": ...}, followed by a "done" event with
+    the full text and any done_data fields, or an "error" event if the generator
+    fails. on_done is called with the full text once the stream completes.
+    """
+    def generate():
+        text = []
+        try:
+            for token in tokens:
+                text.append(token)
+                yield sse_event({"token": token})
+        except Exception as e:
+            yield sse_event({"error": str(e)}, event="error")
+            return
+
+        if on_done is not None:
+            try:
+                on_done("".join(text))
+            except Exception as e:
+                print(f"Error finishing stream: {e}")
+        yield sse_event({**(done_data or {}), "response": "".join(text)}, event="done")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop proxies from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
@@ -0,0 +1,231 @@
+"""Offline end-to-end benchmark of every route.
+
+Builds the app from api.create_app() with in-process fakes for Firestore,
+Pinecone, OpenAI and Firebase Auth (see benchmarks/fakes.py), each with
+injected latency. Then it drives every endpoint at a fixed concurrency and
+reports p50/p95/p99 latency and throughput per endpoint.
+
+    python benchmarks/e2e.py --requests 200 --concurrency 16 --llm-latency 1.5
+
+Needs no credentials or network access.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Must be set before config is imported
+os.environ.setdefault("PREWARM_CLIENTS", "0")
+os.environ.setdefault("AUTH_CERT_REFRESH_SECONDS", "0")
+os.environ.setdefault("INDEX_DEBOUNCE_SECONDS", "0.05")
+os.environ.setdefault("VECTOR_BACKEND", "local")
+os.environ.setdefault("LOCAL_VECTOR_PATH", "")
+
+from benchmarks.fakes import (  # noqa: E402
+    FakeFirestore,
+    FakeEmbeddings,
+    FakeOpenAI,
+    LatencyBackend,
+    fake_verify_id_token,
+    fake_user,
+    fake_get_users,
+)
+
+OWNER = "owner"
+HEADERS = {"Authorization": f"Bearer token-{OWNER}"}
+
+
+def install_fakes(args):
+    """Points every client getter at a fake"""
+    from firebase_admin import auth
+    from services import clients
+    from services.embedding_cache import CachedEmbeddings
+    from services.vector_backends import LocalBackend
+
+    store = FakeFirestore(args.firestore_latency)
+    clients.set_client("firebase", object())
+    clients.set_client("firestore", store)
+    clients.set_client("notes", store.collection("notes"))
+    clients.set_client("openai", FakeOpenAI(args.llm_latency))
+    clients.set_client("embeddings", CachedEmbeddings(FakeEmbeddings(args.embedding_latency), "fake"))
+    clients.set_client("vectors", LatencyBackend(LocalBackend(), args.vector_latency))
+
+    auth.verify_id_token = fake_verify_id_token
+    auth.get_user = fake_user
+    auth.get_user_by_email = fake_user
+    auth.get_users = fake_get_users
+    return store
+
+
+def make_note(i, blocks):
+    return {
+        "title": f"Lecture {i}",
+        "description": f"Notes from lecture {i}",
+        "owner": OWNER,
+        "permissions": {"view": [], "edit": [], "names": {}, "global": None},
+        "content": [
+            {
+                "type": "text",
+                "id": f"block-{j}",
+                "position": None,
+                "value": f"Lecture {i}, point {j}: eigenvalues and eigenvectors of matrix {j}. " * 5,
+                "style": {"formatting": [], "align": "left"},
+            }
+            for j in range(blocks)
+        ],
+    }
+
+
+def percentile(values, p):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Runner:
+    def __init__(self, app, concurrency):
+        self.app = app
+        self.concurrency = concurrency
+        self.local = threading.local()
+
+    def client(self):
+        # Flask test clients aren't meant to be shared between threads
+        if not hasattr(self.local, "client"):
+            self.local.client = self.app.test_client()
+        return self.local.client
+
+    def run(self, name, count, request):
+        latencies, errors = [], 0
+
+        def one(i):
+            start = time.perf_counter()
+            response = request(self.client(), i)
+            # Read the whole body, so streamed responses are timed to the end
+            response.get_data()
+            return time.perf_counter() - start, response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            for latency, status in executor.map(one, range(count)):
+                latencies.append(latency)
+                errors += status >= 400
+        elapsed = time.perf_counter() - start
+
+        return {
+            "endpoint": name,
+            "requests": count,
+            "errors": errors,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "throughput_rps": count / elapsed,
+        }
+
+
+def scenarios(note_ids, created, blocks):
+    """Maps endpoint names to functions sending their i-th request"""
+    def note_id(i):
+        return note_ids[i % len(note_ids)]
+
+    def put(client, i):
+        note = make_note(i % len(note_ids), blocks)
+        note["id"] = note_id(i)
+        # Edit one block, like an autosave
+        note["content"][i % blocks]["value"] = f"Edited in request {i}"
+        return client.put(f"/notes/{note['id']}", json=note, headers=HEADERS)
+
+    revisions = {}
+
+    def patch(client, i):
+        # Edit one block like an autosave, retrying with the latest revision on a conflict
+        id = note_id(i)
+        ops = [{"op": "update", "id": f"block-{i % blocks}", "block": {"value": f"Patched in request {i}"}}]
+        while True:
+            response = client.patch(f"/notes/{id}", json={"baseRevision": revisions.get(id, 1), "ops": ops}, headers=HEADERS)
+            body = response.get_json()
+            revisions[id] = body.get("revision", revisions.get(id, 1))
+            if response.status_code != 409:
+                return response
+
+    def add(client, i):
+        response = client.post("/notes", json=make_note(i, blocks), headers=HEADERS)
+        created.append(response.get_json()["id"])
+        return response
+
+    return {
+        "POST /notes": add,
+        "GET /notes": lambda client, i: client.get("/notes", headers=HEADERS),
+        "GET /notes/<id>": lambda client, i: client.get(f"/notes/{note_id(i)}", headers=HEADERS),
+        "PUT /notes/<id>": put,
+        "PATCH /notes/<id>": patch,
+        "GET /notes/<id>/search": lambda client, i: client.get(f"/notes/{note_id(i)}/search?q=question {i % 5}", headers=HEADERS),
+        "GET /notes/search": lambda client, i: client.get(f"/notes/search?q=eigenvalues question {i % 5}", headers=HEADERS),
+        "GET /notes/<id>/search (SSE)": lambda client, i: client.get(f"/notes/{note_id(i)}/search?q=question {i % 5}&stream=true", headers=HEADERS),
+        "POST /notes/<id>/share": lambda client, i: client.post(
+            f"/notes/{note_id(i)}/share",
+            json={"user": {f"student{i % 60}@example.com": "view"}, "global": None},
+            headers=HEADERS,
+        ),
+        "POST /ai/summarize": lambda client, i: client.post("/ai/summarize", json={"id": note_id(i)}, headers=HEADERS),
+        "POST /ai/flashcards": lambda client, i: client.post("/ai/flashcards", json={"id": note_id(i)}, headers=HEADERS),
+        "POST /ai/chat": lambda client, i: client.post("/ai/chat", json={"message": f"Question {i % 10}"}, headers=HEADERS),
+        "DELETE /notes/<id>": lambda client, i: client.delete(f"/notes/{created[i % len(created)]}", headers=HEADERS),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--notes", type=int, default=20, help="notes to seed")
+    parser.add_argument("--blocks", type=int, default=30, help="content blocks per note")
+    parser.add_argument("--firestore-latency", type=float, default=0.02, help="seconds per Firestore call")
+    parser.add_argument("--vector-latency", type=float, default=0.03, help="seconds per vector store call")
+    parser.add_argument("--embedding-latency", type=float, default=0.15, help="seconds per embeddings call")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="seconds per LLM completion")
+    parser.add_argument("--endpoints", help="comma-separated substrings selecting endpoints to run")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    install_fakes(args)
+    from api import create_app
+    from services.indexing_queue import flush
+
+    app = create_app()
+    runner = Runner(app, args.concurrency)
+
+    seed = app.test_client()
+    note_ids = [seed.post("/notes", json=make_note(i, args.blocks), headers=HEADERS).get_json()["id"] for i in range(args.notes)]
+    flush()
+
+    created = []
+    results = []
+    for name, request in scenarios(note_ids, created, args.blocks).items():
+        if args.endpoints and not any(part in name for part in args.endpoints.split(",")):
+            continue
+        if name.startswith("DELETE") and not created:
+            continue
+        results.append(runner.run(name, args.requests, request))
+        flush()
+
+    print(f"{'endpoint':<32} {'reqs':>5} {'errs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for result in results:
+        print(
+            f"{result['endpoint']:<32} {result['requests']:>5} {result['errors']:>5} "
+            f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['throughput_rps']:>8.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
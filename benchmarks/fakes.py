@@ -0,0 +1,411 @@
+"""In-process stand-ins for Firestore, Pinecone, OpenAI and Firebase Auth.
+
+Each fake sleeps for a configurable latency per call, so the benchmarks can
+model network time without a network.
+"""
+import copy
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from google.cloud.firestore_v1.transforms import Sentinel
+from services.vector_backends import VectorBackend
+
+DIMENSION = 1536
+
+
+def _get_path(data, path):
+    for part in path.split("."):
+        if not isinstance(data, dict) or part not in data:
+            raise KeyError(path)
+        data = data[part]
+    return data
+
+
+def _resolve(value):
+    """Replaces SERVER_TIMESTAMP sentinels with the current time"""
+    if isinstance(value, Sentinel):
+        return datetime.now(timezone.utc)
+    if isinstance(value, dict):
+        return {key: _resolve(item) for key, item in value.items()}
+    return value
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def get(self, field):
+        return _get_path(self._data, field)
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class FakeDocument:
+    def __init__(self, store, path, id):
+        self.store = store
+        self.path = path
+        self.id = id
+
+    def get(self, field_paths=None, transaction=None):
+        if transaction is not None:
+            transaction.lock(self.path)
+        self.store.wait()
+        with self.store.lock:
+            data = copy.deepcopy(self.store.documents.get(self.path))
+        if data is not None and field_paths is not None:
+            data = {field: data[field] for field in field_paths if field in data}
+        return FakeSnapshot(self, data)
+
+    def set(self, data, merge=False):
+        self.store.wait()
+        with self.store.lock:
+            data = _resolve(copy.deepcopy(data))
+            if merge and self.path in self.store.documents:
+                self.store.documents[self.path].update(data)
+            else:
+                self.store.documents[self.path] = data
+
+    def update(self, data):
+        self.store.wait()
+        with self.store.lock:
+            if self.path not in self.store.documents:
+                raise KeyError(self.path)
+            for field, value in _resolve(copy.deepcopy(data)).items():
+                target = self.store.documents[self.path]
+                parts = field.split(".")
+                for part in parts[:-1]:
+                    target = target.setdefault(part, {})
+                target[parts[-1]] = value
+
+    def delete(self):
+        self.store.wait()
+        with self.store.lock:
+            self.store.documents.pop(self.path, None)
+
+    def collection(self, name):
+        return FakeCollection(self.store, f"{self.path}/{name}")
+
+
+def _matches(data, filter):
+    if hasattr(filter, "filters"):
+        results = [_matches(data, sub) for sub in filter.filters]
+        return any(results) if filter.operator.name == "OR" else all(results)
+
+    try:
+        value = _get_path(data, filter.field_path)
+    except KeyError:
+        return False
+    op, operand = filter.op_string, filter.value
+    if op == "==":
+        return value == operand
+    if op == "array_contains":
+        return isinstance(value, list) and operand in value
+    if op == "array_contains_any":
+        return isinstance(value, list) and any(item in value for item in operand)
+    if op == "in":
+        return value in operand
+    if op == ">=":
+        return value >= operand
+    if op == ">":
+        return value > operand
+    if op == "<=":
+        return value <= operand
+    if op == "<":
+        return value < operand
+    raise ValueError(f"Unsupported operator {op}")
+
+
+class FakeQuery:
+    def __init__(self, collection, filters=(), order=None, after=None, count=None, fields=None):
+        self.collection = collection
+        self.filters = list(filters)
+        self.order = order
+        self.after = after
+        self.count = count
+        self.fields = fields
+
+    def _copy(self, **changes):
+        query = FakeQuery(self.collection, self.filters, self.order, self.after, self.count, self.fields)
+        for key, value in changes.items():
+            setattr(query, key, value)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is None:
+            filter = SimpleNamespace(field_path=field_path, op_string=op_string, value=value)
+        return self._copy(filters=self.filters + [filter])
+
+    def order_by(self, field, direction="ASCENDING"):
+        return self._copy(order=(field, direction))
+
+    def start_after(self, values):
+        return self._copy(after=values)
+
+    def limit(self, count):
+        return self._copy(count=count)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def stream(self):
+        store = self.collection.store
+        store.wait()
+        prefix = self.collection.path + "/"
+        with store.lock:
+            rows = [
+                (path, copy.deepcopy(data))
+                for path, data in store.documents.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+        rows = [(path, data) for path, data in rows if all(_matches(data, f) for f in self.filters)]
+
+        if self.order:
+            field, direction = self.order
+            reverse = direction == "DESCENDING"
+
+            def key(row):
+                # "__name__" orders by document ID
+                return row[0] if field == "__name__" else _get_path(row[1], field)
+
+            rows.sort(key=key, reverse=reverse)
+            if self.after is not None:
+                if isinstance(self.after, dict):
+                    after = self.after[field]
+                elif field == "__name__":
+                    after = self.after.reference.path
+                else:
+                    after = self.after.get(field)
+                rows = [row for row in rows if (key(row) < after if reverse else key(row) > after)]
+        if self.count is not None:
+            rows = rows[:self.count]
+
+        for path, data in rows:
+            if self.fields is not None:
+                data = {field: data[field] for field in self.fields if field in data}
+            yield FakeSnapshot(FakeDocument(store, path, path.rsplit("/", 1)[1]), data)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, store, path):
+        super().__init__(self)
+        self.store = store
+        self.path = path
+
+    def document(self, id):
+        return FakeDocument(self.store, f"{self.path}/{id}", id)
+
+
+class FakeTransaction:
+    """Locks each document it reads until commit, buffering writes until then.
+
+    Implements the parts of Transaction used by firestore.transactional.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.writes = []
+        self.locks = []
+        self._id = None
+        self._read_only = False
+        self._max_attempts = 5
+
+    def _clean_up(self):
+        self.writes = []
+
+    def _begin(self, retry_id=None):
+        self._id = object()
+
+    def lock(self, path):
+        with self.store.lock:
+            lock = self.store.document_locks.setdefault(path, threading.Lock())
+        if lock not in self.locks:
+            lock.acquire()
+            self.locks.append(lock)
+
+    def _release(self):
+        self.writes = []
+        while self.locks:
+            self.locks.pop().release()
+
+    def _commit(self):
+        for write in self.writes:
+            write()
+        self._release()
+
+    def _rollback(self):
+        self._release()
+
+    def set(self, reference, data, merge=False):
+        self.writes.append(lambda: reference.set(data, merge=merge))
+
+    def update(self, reference, data):
+        self.writes.append(lambda: reference.update(data))
+
+    def delete(self, reference):
+        self.writes.append(reference.delete)
+
+
+class FakeBatch(FakeTransaction):
+    """Buffers writes until commit"""
+
+    def commit(self):
+        self._commit()
+
+
+class FakeFirestore:
+    """A dict of documents keyed by path, with latency per operation"""
+
+    def __init__(self, latency=0.0):
+        self.documents = {}
+        self.lock = threading.RLock()
+        self.document_locks = {}  # path -> lock held by a transaction
+        self.latency = latency
+
+    def wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for reference in references:
+            yield reference.get(field_paths, transaction=transaction)
+
+
+class FakeEmbeddings:
+    """Deterministic pseudo-embeddings derived from a hash of the text"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        vectors = []
+        for text in texts:
+            seed = hashlib.sha256(text.encode("utf-8")).digest()
+            vectors.append([(seed[i % len(seed)] - 128) / 128 for i in range(DIMENSION)])
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class LatencyBackend(VectorBackend):
+    """Adds a network round trip to every call of another vector backend"""
+
+    def __init__(self, backend, latency=0.0):
+        self.backend = backend
+        self.latency = latency
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def list_ids(self, namespace, prefix=None):
+        self._wait()
+        return self.backend.list_ids(namespace, prefix)
+
+    def upsert(self, namespace, records):
+        self._wait()
+        return self.backend.upsert(namespace, records)
+
+    def delete(self, namespace, ids=None):
+        self._wait()
+        return self.backend.delete(namespace, ids)
+
+    def query(self, namespace, vector, top_k, filter=None, include_values=False):
+        self._wait()
+        return self.backend.query(namespace, vector, top_k, filter=filter, include_values=include_values)
+
+    def fetch(self, namespace, ids):
+        self._wait()
+        return self.backend.fetch(namespace, ids)
+
+    def describe_stats(self):
+        self._wait()
+        return self.backend.describe_stats()
+
+
+class _Completions:
+    def __init__(self, openai):
+        self.openai = openai
+
+    def create(self, model, messages, stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        if "flashcards" in prompt:
+            answer = json.dumps([{"term": "Term", "definition": "Definition"}])
+        else:
+            answer = "This is a generated answer about the note. " * 4
+        usage = SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(answer) // 4, total_tokens=(len(prompt) + len(answer)) // 4)
+
+        if not stream:
+            time.sleep(self.openai.latency)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=answer))],
+                usage=usage,
+            )
+
+        def chunks():
+            time.sleep(self.openai.first_token_latency)
+            words = answer.split(" ")
+            for word in words:
+                time.sleep((self.openai.latency - self.openai.first_token_latency) / len(words))
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word + " "))], usage=None)
+            yield SimpleNamespace(choices=[], usage=usage)
+
+        return chunks()
+
+
+class FakeOpenAI:
+    """Chat completions that take `latency` seconds, streaming after `first_token_latency`"""
+
+    def __init__(self, latency=0.0, first_token_latency=None):
+        self.latency = latency
+        self.first_token_latency = latency / 4 if first_token_latency is None else first_token_latency
+        self.chat = SimpleNamespace(completions=_Completions(self))
+
+
+def fake_verify_id_token(id_token, *args, **kwargs):
+    """Accepts tokens of the form "token-<uid>" """
+    if not id_token.startswith("token-"):
+        raise ValueError("Invalid token")
+    return {"uid": id_token[len("token-"):], "exp": time.time() + 3600}
+
+
+def fake_user(identifier):
+    uid = identifier.split("@")[0]
+    return SimpleNamespace(uid=uid, email=f"{uid}@example.com", display_name=uid.title())
+
+
+def fake_get_users(identifiers):
+    """Finds every user except those whose uid starts with "missing" """
+    users, not_found = [], []
+    for identifier in identifiers:
+        value = getattr(identifier, "email", None) or identifier.uid
+        user = fake_user(value)
+        if user.uid.startswith("missing"):
+            not_found.append(identifier)
+        else:
+            users.append(user)
+    return SimpleNamespace(users=users, not_found=not_found)
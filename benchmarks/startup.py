@@ -0,0 +1,59 @@
+"""Measures how long the server takes to import and build the Flask app.
+
+Each run starts a fresh interpreter, like a cold container would. Clients are
+created lazily, so this needs no credentials or network access.
+
+    python benchmarks/startup.py --runs 10 --max-seconds 2.5
+
+Exits with status 1 if the median exceeds --max-seconds, so it can gate CI.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP = """
+import time
+start = time.perf_counter()
+from api import create_app
+create_app()
+print(time.perf_counter() - start)
+"""
+
+
+def measure(runs):
+    env = dict(os.environ, PREWARM_CLIENTS="0", AUTH_CERT_REFRESH_SECONDS="0")
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    timings = measure(args.runs)
+    median = statistics.median(timings)
+    print(f"startup over {args.runs} runs: median {median:.3f}s, min {min(timings):.3f}s, max {max(timings):.3f}s")
+
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"startup regression: median {median:.3f}s exceeds {args.max_seconds:.3f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,4 +12,87 @@ load_dotenv()
 # API Keys
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-GOOGLE_SERVICE_ACCOUNT = os.getenv("GOOGLE_SERVICE_ACCOUNT")
\ No newline at end of file
+GOOGLE_SERVICE_ACCOUNT = os.getenv("GOOGLE_SERVICE_ACCOUNT")
+
+# Background indexing
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "2"))
+INDEX_DEBOUNCE_SECONDS = float(os.getenv("INDEX_DEBOUNCE_SECONDS", "2"))
+INDEX_DRAIN_TIMEOUT = float(os.getenv("INDEX_DRAIN_TIMEOUT", "30"))
+# A note read this long after its last save, with that revision still not
+# indexed, is queued again, e.g. if the instance indexing it was killed
+INDEX_RECOVER_SECONDS = float(os.getenv("INDEX_RECOVER_SECONDS", "60"))
+
+# Embedding cache, set EMBEDDING_CACHE_PATH to keep embeddings across restarts
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+
+# Vector store, "pinecone" or "local" (memory-mapped files under LOCAL_VECTOR_PATH,
+# or in memory only if LOCAL_VECTOR_PATH is empty)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+LOCAL_VECTOR_PATH = os.getenv("LOCAL_VECTOR_PATH", "vectors")
+
+# Print vector store stats around every save, this costs extra round trips
+DEBUG_INDEX_STATS = bool(os.getenv("DEBUG_INDEX_STATS"))
+
+# Auth, verified ID tokens are cached until they expire
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CERT_REFRESH_SECONDS = float(os.getenv("AUTH_CERT_REFRESH_SECONDS", "3600"))
+
+# Summaries, long notes are summarized in sections and then combined
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))
+SUMMARY_CHUNK_SIZE = int(os.getenv("SUMMARY_CHUNK_SIZE", "8000"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "2000"))
+
+# Regenerate a note's existing summary/flashcards in the background after each save
+ARTIFACT_PREGENERATE = bool(os.getenv("ARTIFACT_PREGENERATE"))
+
+# Create Firestore, OpenAI and vector store clients in the background at startup
+# instead of on the first request that needs them
+PREWARM_CLIENTS = os.getenv("PREWARM_CLIENTS", "1") != "0"
+
+# GET /notes?q= catches up with notes saved or shared through other instances
+# at most this often, see services.search_index
+SEARCH_INDEX_SYNC_SECONDS = float(os.getenv("SEARCH_INDEX_SYNC_SECONDS", "5"))
+
+# Requests each gunicorn worker serves at once, see gunicorn.conf.py
+WORKER_CONNECTIONS = int(os.getenv("WORKER_CONNECTIONS", "500"))
+
+# Outbound OpenAI and Pinecone calls share one connection pool and retry policy.
+# The pool is sized for the number of requests a worker serves at once.
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", str(WORKER_CONNECTIONS)))
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", str(UPSTREAM_CONCURRENCY)))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "60"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "4"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_CAP = float(os.getenv("UPSTREAM_BACKOFF_CAP", "20"))
+
+# RAG context, the best of up to CONTEXT_MAX_CHUNKS retrieved chunks are added
+# until the context reaches CONTEXT_TOKEN_BUDGET tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "12"))
+
+# Searching across all of a user's notes fetches the best CROSS_NOTE_FETCH_K chunks,
+# at most CROSS_NOTE_CHUNKS_PER_NOTE from each note. Users with very many notes
+# are queried in batches, CROSS_NOTE_CONCURRENCY at a time.
+CROSS_NOTE_FETCH_K = int(os.getenv("CROSS_NOTE_FETCH_K", "50"))
+CROSS_NOTE_CHUNKS_PER_NOTE = int(os.getenv("CROSS_NOTE_CHUNKS_PER_NOTE", "4"))
+CROSS_NOTE_CONCURRENCY = int(os.getenv("CROSS_NOTE_CONCURRENCY", "8"))
+CROSS_NOTE_TOKEN_BUDGET = int(os.getenv("CROSS_NOTE_TOKEN_BUDGET", "3000"))
+
+# Retrieval over-fetches RAG_FETCH_K candidates, then picks the context chunks
+# with maximal marginal relevance (RAG_MMR_LAMBDA=1 turns it off) after blending
+# in RAG_LEXICAL_WEIGHT of keyword matching. MMR compares the candidates' vectors,
+# taken from the embedding cache and only fetched from the vector store on a miss.
+RAG_FETCH_K = int(os.getenv("RAG_FETCH_K", "30"))
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.5"))
+RAG_LEXICAL_WEIGHT = float(os.getenv("RAG_LEXICAL_WEIGHT", "0.3"))
+
+# Users looked up when sharing, by email or uid, are cached for USER_CACHE_TTL seconds
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+# Answers to questions within ANSWER_CACHE_THRESHOLD cosine similarity of an
+# earlier question about the same indexed note revision are reused, set ANSWER_CACHE_SIZE=0 to disable
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
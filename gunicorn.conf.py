@@ -0,0 +1,15 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import WORKER_CONNECTIONS  # noqa: E402
+
+# Requests spend almost all their time waiting on Firestore, Pinecone and OpenAI,
+# so a single gevent worker multiplexes many of them on cooperative greenlets
+# instead of tying up one OS thread per request.
+bind = f":{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WORKERS", "1"))
+worker_class = "gevent"
+worker_connections = WORKER_CONNECTIONS
+timeout = 0
@@ -1,3 +1,14 @@
+import sys
+
+if "gevent" in sys.modules:
+    from gevent import monkey
+
+    if monkey.is_module_patched("socket"):
+        # Firestore talks gRPC, which needs to be told it's running under gevent
+        # before any channel is created
+        from grpc.experimental import gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+
 from api import create_app
 
 app = create_app()
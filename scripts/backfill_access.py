@@ -0,0 +1,69 @@
+"""Adds the "access" field to notes written before it existed.
+
+GET /notes only finds notes through access (see services.access), so run this
+once against each environment before deploying the new listing query:
+
+    python scripts/backfill_access.py --dry-run
+    python scripts/backfill_access.py
+
+Notes are read in pages of owner/permissions fields only, and written in
+batched commits, skipping notes whose access is already correct. Safe to rerun.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.cloud.firestore_v1.field_path import FieldPath  # noqa: E402
+from services.access import access_list  # noqa: E402
+from services.clients import get_firestore, get_note_ref  # noqa: E402
+
+# Firestore commits at most 500 writes at a time
+MAX_BATCH = 500
+
+
+def backfill(page_size=MAX_BATCH, dry_run=False):
+    """Sets access on every note that's missing it or has a stale one, returning (scanned, updated)"""
+    firestore = get_firestore()
+    scanned = updated = 0
+    last = None
+
+    while True:
+        query = get_note_ref().order_by(FieldPath.document_id()).select(["owner", "permissions", "access"]).limit(page_size)
+        if last is not None:
+            query = query.start_after(last)
+        page = list(query.stream())
+        if not page:
+            break
+
+        batch = firestore.batch()
+        writes = 0
+        for note in page:
+            data = note.to_dict()
+            access = access_list(data)
+            if data.get("access") != access:
+                batch.update(note.reference, {"access": access})
+                writes += 1
+        if writes and not dry_run:
+            batch.commit()
+
+        scanned += len(page)
+        updated += writes
+        last = page[-1]
+        print(f"Scanned {scanned} notes, {'would update' if dry_run else 'updated'} {updated}")
+
+    return scanned, updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=MAX_BATCH, help=f"notes per page and commit, at most {MAX_BATCH}")
+    parser.add_argument("--dry-run", action="store_true", help="count the notes to update without writing")
+    args = parser.parse_args()
+
+    backfill(min(args.page_size, MAX_BATCH), args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
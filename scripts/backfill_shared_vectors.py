@@ -0,0 +1,60 @@
+"""Copies the vectors of notes indexed before the shared namespace existed.
+
+GET /notes/search only finds chunks in the shared namespace (see
+services.vectorstore_service.SHARED_NAMESPACE), which notes only reach when
+they're next saved. Run this once against each environment to index the rest:
+
+    python scripts/backfill_shared_vectors.py
+
+Each note is re-indexed as it is. Chunks already stored in both namespaces are
+kept, so only missing ones are embedded and written. Safe to rerun.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.cloud.firestore_v1.field_path import FieldPath  # noqa: E402
+from services.clients import get_note_ref  # noqa: E402
+from services.rag import rag_store  # noqa: E402
+
+PAGE_SIZE = 100
+
+
+def backfill(page_size=PAGE_SIZE):
+    """Re-indexes every note, returning (scanned, failed)"""
+    scanned = failed = 0
+    last = None
+
+    while True:
+        query = get_note_ref().order_by(FieldPath.document_id()).select(["content", "revision"]).limit(page_size)
+        if last is not None:
+            query = query.start_after(last)
+        page = list(query.stream())
+        if not page:
+            break
+
+        for note in page:
+            data = note.to_dict()
+            data["id"] = note.id
+            if not rag_store(data):
+                failed += 1
+
+        scanned += len(page)
+        last = page[-1]
+        print(f"Indexed {scanned} notes, {failed} failed")
+
+    return scanned, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="notes read at a time")
+    args = parser.parse_args()
+
+    backfill(args.page_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+def access_list(note_data):
+    """Returns the uids that can see a note: its owner, editors and viewers.
+
+    Stored on each note as "access", so listing a user's notes is a single
+    array_contains query. Must be rewritten whenever owner or permissions change.
+    """
+    permissions = note_data.get("permissions") or {}
+    uids = [note_data.get("owner")] + list(permissions.get("edit") or []) + list(permissions.get("view") or [])
+    return sorted({uid for uid in uids if uid})
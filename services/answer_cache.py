@@ -0,0 +1,148 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config import ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD
+from services.clients import get_embeddings
+from services.metrics import increment
+
+# Reuses LLM answers for questions that mean the same thing. Answers are kept
+# per scope, e.g. ("search", note_id, indexed revision), so once a new revision
+# of a note is indexed it never sees answers about an older one, and are matched
+# by the cosine similarity of the questions' embeddings. Chat answers are scoped
+# to the normalized message itself, see api.aiAPI.chat.
+
+
+class _Scope:
+    """The vectors of one scope's cached questions, in a growable matrix"""
+
+    def __init__(self, dimension):
+        self.vectors = np.zeros((4, dimension), dtype=np.float32)
+        self.keys = [None] * 4  # slot -> entry key, None if free
+        self.free = list(range(3, -1, -1))
+
+    def add(self, key, vector):
+        if not self.free:
+            size = len(self.keys)
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+            self.keys += [None] * size
+            self.free = list(range(2 * size - 1, size - 1, -1))
+        slot = self.free.pop()
+        self.vectors[slot] = vector
+        self.keys[slot] = key
+        return slot
+
+    def remove(self, slot):
+        self.vectors[slot] = 0
+        self.keys[slot] = None
+        self.free.append(slot)
+
+    def best(self, vector):
+        """Returns (entry key, similarity) of the most similar question"""
+        scores = self.vectors @ vector
+        slot = int(np.argmax(scores))
+        return self.keys[slot], float(scores[slot])
+
+    def empty(self):
+        return len(self.free) == len(self.keys)
+
+
+class SemanticCache:
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (scope, slot, answer, expiry), least recently used first
+        self.scopes = {}  # scope -> _Scope
+        self.ids = itertools.count()
+        self.counters = {"hit": 0, "miss": 0}
+
+    def _count(self, result):
+        self.counters[result] += 1
+        increment("noteflow_answer_cache_total", help="Semantic answer cache lookups", result=result)
+
+    def _remove(self, key):
+        scope, slot, _, _ = self.entries.pop(key)
+        self.scopes[scope].remove(slot)
+        if self.scopes[scope].empty():
+            del self.scopes[scope]
+
+    def lookup(self, scope, vector):
+        """Returns the answer to the most similar cached question in scope, or None"""
+        with self.lock:
+            index = self.scopes.get(scope)
+            key, similarity = index.best(vector) if index is not None else (None, 0)
+            if key is not None and similarity >= self.threshold:
+                _, _, answer, expiry = self.entries[key]
+                if expiry > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self._count("hit")
+                    return answer
+                self._remove(key)
+            self._count("miss")
+            return None
+
+    def store(self, scope, vector, answer):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            index = self.scopes.get(scope)
+            if index is None:
+                index = self.scopes[scope] = _Scope(len(vector))
+            key = next(self.ids)
+            self.entries[key] = (scope, index.add(key, vector), answer, time.monotonic() + self.ttl)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, note_id):
+        """Drops every answer about a note, e.g. once it's edited or deleted"""
+        with self.lock:
+            for key, (scope, _, _, _) in list(self.entries.items()):
+                if scope[1] == note_id:
+                    self._remove(key)
+
+    def stats(self):
+        with self.lock:
+            stats = {"hits": self.counters["hit"], "misses": self.counters["miss"], "entries": len(self.entries)}
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_cache = SemanticCache()
+
+
+def embed_question(query):
+    """Embeds a question as a unit vector. Retrieval embeds the same text, which the embedding cache then serves."""
+    vector = np.asarray(get_embeddings().embed_query(query), dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1)
+
+
+def lookup(scope, query):
+    """Returns (cached answer or None, question vector to store a new answer with)"""
+    vector = embed_question(query)
+    return _cache.lookup(scope, vector), vector
+
+
+def store(scope, vector, answer):
+    _cache.store(scope, vector, answer)
+
+
+def cached_answer(scope, query, compute):
+    """Returns a cached answer to a similar question in scope, or computes and caches one"""
+    answer, vector = lookup(scope, query)
+    if answer is None:
+        answer = compute()
+        if answer is not None:
+            store(scope, vector, answer)
+    return answer
+
+
+def invalidate(note_id):
+    _cache.invalidate(note_id)
+
+
+def stats():
+    return _cache.stats()
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from firebase_admin import firestore
+from services.clients import get_note_ref
+from services.llm_service import query_llm
+from services.metrics import span
+from services.summarizer import summarize_note
+from services.text_processing import note_blocks
+
+# Bump to invalidate stored artifacts when prompts or parsing change
+ARTIFACT_VERSION = 1
+
+FLASHCARDS_PROMPT = "Create flashcards from the note content above in a JSON list using form {\"term\": \"A\", \"definition\": \"The definition of A\" }. Do not return nothing else."
+REMOVE_FORMATTING = re.compile(r"(```json)*([^`]+)*(```)*")
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="artifacts")
+
+
+def generate_flashcards(note_data):
+    """Generates a list of {"term", "definition"} flashcards from a note"""
+    content = "\n".join(note_blocks(note_data)[0])
+    response = query_llm(FLASHCARDS_PROMPT, content, "")
+
+    if response is None:
+        raise RuntimeError("Error generating flashcards")
+
+    # replace backticks, newlines, and extra spaces
+    response = REMOVE_FORMATTING.sub(r'\2', response).strip()
+    return json.loads(response)
+
+
+GENERATORS = {
+    "summary": summarize_note,
+    "flashcards": generate_flashcards,
+}
+
+
+def content_hash(note_data):
+    """Hashes the note content that artifacts are generated from"""
+    digest = hashlib.sha256(f"v{ARTIFACT_VERSION}".encode("utf-8"))
+    for text in note_blocks(note_data)[0]:
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _artifact_ref(note_id):
+    # Artifacts live in a subcollection so full-note PUTs don't overwrite them
+    return get_note_ref().document(note_id).collection('artifacts')
+
+
+def load_artifact(note_id, note_data, kind):
+    """Returns a stored artifact if it was generated from the note's current content"""
+    with span("firestore_read"):
+        doc = _artifact_ref(note_id).document(kind).get()
+    if doc.exists and doc.get("hash") == content_hash(note_data):
+        return doc.get("data")
+    return None
+
+
+def save_artifact(note_id, note_data, kind, data):
+    with span("firestore_write"):
+        _artifact_ref(note_id).document(kind).set({
+            "hash": content_hash(note_data),
+            "data": data,
+            "createdAt": firestore.SERVER_TIMESTAMP,
+        })
+
+
+def get_artifact(note_id, note_data, kind):
+    """Returns an up-to-date artifact, generating and storing it if needed"""
+    data = load_artifact(note_id, note_data, kind)
+    if data is None:
+        data = GENERATORS[kind](note_data)
+        save_artifact(note_id, note_data, kind, data)
+    return data
+
+
+def refresh_artifacts(note_data):
+    """Regenerates, in the background, the stale artifacts a note already has.
+
+    Artifacts that were never requested aren't generated.
+    """
+    note_id = note_data.get("id")
+    if not note_id:
+        return
+
+    def refresh():
+        try:
+            current = content_hash(note_data)
+            for doc in _artifact_ref(note_id).stream():
+                if doc.id in GENERATORS and doc.get("hash") != current:
+                    save_artifact(note_id, note_data, doc.id, GENERATORS[doc.id](note_data))
+        except Exception as e:
+            print(f"Error refreshing artifacts for note {note_id}: {e}")
+
+    _executor.submit(refresh)
+
+
+def delete_artifacts(note_id):
+    """Deletes all stored artifacts of a note"""
+    for doc in _artifact_ref(note_id).stream():
+        doc.reference.delete()
@@ -0,0 +1,136 @@
+import json
+import threading
+from config import (
+    GOOGLE_SERVICE_ACCOUNT,
+    OPENAI_API_KEY,
+    PINECONE_API_KEY,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_PATH,
+    VECTOR_BACKEND,
+    LOCAL_VECTOR_PATH,
+    UPSTREAM_POOL_SIZE,
+    UPSTREAM_TIMEOUT,
+)
+from services.upstream import get_http_client, UpstreamEmbeddings
+
+# Clients are created on first use rather than at import, keeping them off the
+# cold-start path. Heavy SDKs are imported inside the factories for the same reason.
+
+INDEX_NAME = "noteflow"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+_instances = {}
+_locks = {}  # one lock per client, so a slow connection doesn't block the others
+_locks_lock = threading.Lock()
+
+
+def _get(name, factory):
+    instance = _instances.get(name)
+    if instance is None:
+        with _locks_lock:
+            lock = _locks.setdefault(name, threading.Lock())
+        with lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _instances[name] = factory()
+    return instance
+
+
+def set_client(name, instance):
+    """Replaces a client, e.g. with a fake in tests and benchmarks"""
+    _instances[name] = instance
+
+
+def existing_client(name):
+    """Returns a client if it has already been created, without creating it"""
+    return _instances.get(name)
+
+
+def get_firebase_app():
+    def create():
+        from firebase_admin import credentials, initialize_app
+
+        if GOOGLE_SERVICE_ACCOUNT:
+            cred = credentials.Certificate(json.loads(GOOGLE_SERVICE_ACCOUNT))
+        else:
+            print("Using key.json for credentials.")
+            cred = credentials.Certificate("api/key.json")
+        return initialize_app(cred)
+
+    return _get("firebase", create)
+
+
+def get_firestore():
+    def create():
+        from firebase_admin import firestore
+
+        get_firebase_app()
+        return firestore.client()
+
+    return _get("firestore", create)
+
+
+def get_note_ref():
+    """Returns the Firestore collection of notes"""
+    return _get("notes", lambda: get_firestore().collection('notes'))
+
+
+def get_openai():
+    def create():
+        from openai import OpenAI
+
+        # Retries happen in services.upstream
+        return OpenAI(
+            api_key=OPENAI_API_KEY,
+            http_client=get_http_client(),
+            timeout=UPSTREAM_TIMEOUT,
+            max_retries=0,
+        )
+
+    return _get("openai", create)
+
+
+def get_embeddings():
+    """Returns the OpenAI embeddings model, cached so identical text is only embedded once"""
+    def create():
+        from langchain_openai import OpenAIEmbeddings
+        from services.embedding_cache import CachedEmbeddings
+
+        return CachedEmbeddings(
+            UpstreamEmbeddings(OpenAIEmbeddings(
+                model = EMBEDDING_MODEL,
+                openai_api_key = OPENAI_API_KEY,
+                http_client = get_http_client(),
+                request_timeout = UPSTREAM_TIMEOUT,
+                max_retries = 0,)),
+            EMBEDDING_MODEL,
+            max_entries=EMBEDDING_CACHE_SIZE,
+            path=EMBEDDING_CACHE_PATH,
+        )
+
+    return _get("embeddings", create)
+
+
+def get_vector_backend():
+    def create():
+        from services.vector_backends import PineconeBackend, LocalBackend
+
+        if VECTOR_BACKEND == "local":
+            return LocalBackend(LOCAL_VECTOR_PATH or None)
+        return PineconeBackend(PINECONE_API_KEY, INDEX_NAME, pool_size=UPSTREAM_POOL_SIZE)
+
+    return _get("vectors", create)
+
+
+def prewarm():
+    """Creates every client in a background thread, so the first request doesn't pay for it"""
+    def warm():
+        for getter in (get_note_ref, get_openai, get_embeddings, get_vector_backend):
+            try:
+                getter()
+            except Exception as e:
+                print(f"Error prewarming {getter.__name__}: {e}")
+
+    thread = threading.Thread(target=warm, name="prewarm", daemon=True)
+    thread.start()
+    return thread
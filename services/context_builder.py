@@ -0,0 +1,154 @@
+import threading
+
+# Tokenizer used by gpt-4o, loaded on first use
+ENCODING_NAME = "o200k_base"
+
+# Chunks from the splitter overlap by at most its chunk_overlap, this leaves slack
+MAX_OVERLAP = 300
+MIN_OVERLAP = 20
+
+SEPARATOR = "\n\n"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+
+                _encoding = tiktoken.get_encoding(ENCODING_NAME)
+            except Exception as e:
+                # tiktoken downloads its tables on first use, which can fail offline
+                print(f"Counting tokens approximately, tiktoken unavailable: {e}")
+                _encoding = False
+        return _encoding
+
+
+def count_tokens(text):
+    """Counts the tokens in text, or estimates 4 characters per token without tiktoken"""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def merge_overlap(first, second):
+    """Joins two chunks if the end of first overlaps the start of second, else returns None"""
+    if second in first:
+        return first
+    for size in range(min(len(first), len(second), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return None
+
+
+def _adjacent(first, second, block_order):
+    """Whether the block range second starts right after first ends, in block_order"""
+    end, start = block_order.get(first[2]), block_order.get(second[1])
+    return end is not None and start is not None and start == end + 1
+
+
+def _join(first, second, block_order=None):
+    """Joins passage second onto first, returning the joined (blocks, text) or None"""
+    (first_blocks, first_text), (second_blocks, second_text) = first, second
+    if first_blocks[0] != second_blocks[0]:
+        return None
+    if first_blocks == second_blocks or first_blocks[2] == second_blocks[1]:
+        # Pieces of the same block, which overlap
+        text = merge_overlap(first_text, second_text)
+    elif block_order and _adjacent(first_blocks, second_blocks, block_order):
+        text = first_text + "\n" + second_text
+    else:
+        text = None
+    if text is None:
+        return None
+    return (first_blocks[0], first_blocks[1], second_blocks[2]), text
+
+
+def _add_chunk(passages, blocks, text, block_order=None):
+    """Returns passages with text added, joined to the passages it overlaps or adjoins.
+
+    Overlapping pieces of the same blocks are joined where they overlap, and
+    chunks of consecutive blocks, if block_order gives their positions, are
+    joined in block order.
+    """
+    passages = list(passages)
+    chunk = (blocks, text)
+    i = 0
+    while i < len(passages):
+        merged = _join(passages[i], chunk, block_order) or _join(chunk, passages[i], block_order)
+        if merged is None:
+            i += 1
+            continue
+        # The joined passage takes the earlier one's place, and may now overlap others
+        del passages[i]
+        chunk = merged
+        i = 0
+    passages.append(chunk)
+    return passages
+
+
+def _format(source, text):
+    return f"[{source}]\n{text}" if source else text
+
+
+def build_context(matches, token_budget, source=None, ordered=False, block_order=None):
+    """Assembles retrieved chunks into prompt context of at most token_budget tokens.
+
+    See pack_context, which also returns the matches used.
+    """
+    return pack_context(matches, token_budget, source, ordered, block_order)[0]
+
+
+def pack_context(matches, token_budget, source=None, ordered=False, block_order=None):
+    """Assembles retrieved chunks into prompt context, returning (context, matches used).
+
+    Matches are taken best first, skipping any that no longer fit, so the budget
+    is filled with as many relevant chunks as it holds. Duplicate chunks are
+    dropped, and overlapping chunks of the same block are joined into one
+    passage. So are chunks of consecutive blocks, given block_order, which maps
+    block IDs to their positions in the note. The best match is always
+    included, even if it alone is over budget.
+
+    source, if given, maps a match to a label such as its note's title, which
+    heads each of its passages so the LLM can attribute what it uses. Pass
+    ordered=True if matches are already best first, e.g. after reranking.
+    """
+    passages = []  # ((source, block range), text)
+    tokens = {}  # formatted passage -> token count
+    used = 0
+    included = []
+
+    if not ordered:
+        matches = sorted(matches, key=lambda match: match.get("score") or 0, reverse=True)
+
+    for match in matches:
+        metadata = match.get("metadata") or {}
+        text = metadata.get("text")
+        if not text:
+            continue
+
+        # Only pieces of the same block can overlap, and only chunks of the same
+        # source adjoin. Vectors stored before chunks covered block ranges have a
+        # block_id instead.
+        label = source(match) if source else None
+        blocks = (label, metadata.get("block_start", metadata.get("block_id")), metadata.get("block_end"))
+        candidate = _add_chunk(passages, blocks, text, block_order)
+        formatted = [_format(key[0], passage) for key, passage in candidate]
+        for passage in formatted:
+            if passage not in tokens:
+                tokens[passage] = count_tokens(passage)
+        total = sum(tokens[passage] for passage in formatted)
+        if passages and total > token_budget:
+            continue
+
+        passages, used = candidate, total
+        included.append(match)
+        if used >= token_budget:
+            break
+
+    return SEPARATOR.join(_format(key[0], passage) for key, passage in passages), included
@@ -0,0 +1,125 @@
+import hashlib
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+
+class CachedEmbeddings:
+    """Wraps a LangChain embeddings model with a content-addressed cache.
+
+    Vectors are keyed by (model, sha256(text)) and kept in a bounded in-memory
+    LRU, backed by an optional SQLite file that survives restarts. They're held
+    as float32 arrays, about 6 KB per 1536-dimension vector rather than 49 KB
+    as a list of floats, and only converted to lists when returned.
+    """
+
+    def __init__(self, embeddings, model, max_entries=10000, path=None):
+        self.embeddings = embeddings
+        self.model = model
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(model TEXT, hash TEXT, vector BLOB, PRIMARY KEY (model, hash))"
+            )
+            self.db.commit()
+
+    def _key(self, text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _lookup(self, keys, count=True):
+        """Returns cached vectors for the keys found in memory or on disk.
+
+        Hits are only counted when count is set, so stats() reflects embedding calls.
+        """
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key].tolist()
+                    if count:
+                        self.counters["memory_hits"] += 1
+
+            missing = [key for key in keys if key not in found]
+            if self.db is not None and missing:
+                for key in missing:
+                    row = self.db.execute(
+                        "SELECT vector FROM embeddings WHERE model = ? AND hash = ?",
+                        (self.model, key),
+                    ).fetchone()
+                    if row:
+                        vector = array("f", row[0])
+                        self._remember(key, vector)
+                        found[key] = vector.tolist()
+                        if count:
+                            self.counters["disk_hits"] += 1
+        return found
+
+    def _store(self, vectors):
+        vectors = {key: array("f", vector) for key, vector in vectors.items()}
+        with self.lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            if self.db is not None:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                    [(self.model, key, vector.tobytes()) for key, vector in vectors.items()],
+                )
+                self.db.commit()
+
+    def embed_documents(self, texts):
+        """Embeds texts, only calling the model for texts that aren't cached"""
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(set(keys))
+
+        # Embed each uncached text once, even if it appears several times
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            with self.lock:
+                self.counters["misses"] += len(missing)
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def cached(self, texts):
+        """Returns the cached vector of each text, or None where it isn't cached, without calling the model.
+
+        These lookups don't replace embedding calls, so they're left out of stats().
+        """
+        keys = [self._key(text) for text in texts]
+        found = self._lookup(set(keys), count=False)
+        return [found.get(key) for key in keys]
+
+    def embed_query(self, text):
+        """Embeds a single query through the cache"""
+        return self.embed_documents([text])[0]
+
+    def stats(self):
+        """Returns hit/miss counters and the current cache size"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self.memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
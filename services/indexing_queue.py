@@ -0,0 +1,223 @@
+import atexit
+import threading
+import time
+from datetime import datetime, timezone
+from config import INDEX_WORKERS, INDEX_DEBOUNCE_SECONDS, INDEX_DRAIN_TIMEOUT, INDEX_RECOVER_SECONDS, ARTIFACT_PREGENERATE
+from services.clients import get_note_ref
+from services.rag import rag_store, rag_remove
+from services.artifacts import refresh_artifacts, delete_artifacts
+from services.metrics import observe
+
+# Index statuses reported to clients
+PENDING = "pending"
+INDEXING = "indexing"
+CURRENT = "current"
+FAILED = "failed"
+
+_lock = threading.Condition()
+_pending = {}  # note_id -> (action, payload, due time)
+_active = set()  # note IDs currently being indexed
+_statuses = {}  # note_id -> status of this process's jobs, notes missing from here have none
+_recovered = {}  # note_id -> when it was last queued again by index_status
+_workers = []
+_stopping = False
+
+
+def _start_workers():
+    """Starts the worker threads on first use"""
+    if _workers:
+        return
+    for i in range(INDEX_WORKERS):
+        worker = threading.Thread(target=_work, name=f"indexer-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+
+def _enqueue(note_id, action, payload, delay):
+    with _lock:
+        if _stopping:
+            raise RuntimeError("Indexing queue is shutting down")
+        # A newer save replaces any queued one, so only the latest version is indexed
+        _pending[note_id] = (action, payload, time.monotonic() + delay)
+        _statuses[note_id] = PENDING
+        _start_workers()
+        _lock.notify_all()
+
+
+def _store(note_data):
+    stored = rag_store(note_data)
+    if ARTIFACT_PREGENERATE:
+        refresh_artifacts(note_data)
+    return stored
+
+
+def _remove(note_id):
+    removed = rag_remove(note_id)
+    delete_artifacts(note_id)
+    return removed
+
+
+def _recover(note_id):
+    """Indexes a note's latest revision as read from Firestore, unless it's indexed by now"""
+    note = get_note_ref().document(note_id).get()
+    if not note.exists:
+        return True
+    note_data = note.to_dict()
+    note_data.setdefault("id", note_id)
+    if is_indexed(note_data):
+        return True
+    return _store(note_data)
+
+
+def index_note(note_data):
+    """Queues a note to be embedded and stored, debouncing rapid saves of the same note"""
+    note_id = note_data.get("id")
+    if not note_id:
+        return False
+    _enqueue(note_id, _store, note_data, INDEX_DEBOUNCE_SECONDS)
+    return True
+
+
+def remove_note(note_id):
+    """Queues removal of a note's vectors and artifacts, cancelling any pending save"""
+    if not note_id:
+        return False
+    _enqueue(note_id, _remove, note_id, 0)
+    return True
+
+
+def is_indexed(note_data):
+    """Whether the vectors of a note's revision are committed, see save_note_vectors"""
+    return note_data.get("indexedRevision", -1) >= note_data.get("revision", 0)
+
+
+def _overdue(note_data):
+    updated = note_data.get("updatedAt")
+    if not isinstance(updated, datetime):
+        return True
+    return (datetime.now(timezone.utc) - updated).total_seconds() > INDEX_RECOVER_SECONDS
+
+
+def index_status(note_data):
+    """Returns whether a note's index is pending, indexing, current or failed.
+
+    note_data is the note as read from Firestore, with at least its revision,
+    indexedRevision and updatedAt, so every instance reports the same status.
+    A revision that's still not indexed INDEX_RECOVER_SECONDS after the save,
+    and isn't queued here, was lost, e.g. to a crash, or failed. It's queued
+    again.
+    """
+    note_id = note_data["id"]
+    with _lock:
+        status = _statuses.get(note_id)
+        if status in (PENDING, INDEXING):
+            return status
+        if is_indexed(note_data):
+            if status == FAILED:
+                # Indexed since, e.g. by another instance
+                del _statuses[note_id]
+            return CURRENT
+
+        # Otherwise it's probably still being indexed by the instance that saved
+        # it, or was queued again too recently
+        now = time.monotonic()
+        if not _overdue(note_data) or now - _recovered.get(note_id, -INDEX_RECOVER_SECONDS) < INDEX_RECOVER_SECONDS:
+            return status or PENDING
+        _recovered[note_id] = now
+    try:
+        _enqueue(note_id, _recover, note_id, 0)
+    except RuntimeError:
+        return status or PENDING
+    return PENDING
+
+
+def _next_job():
+    """Waits for a note whose debounce has expired and that isn't already being indexed"""
+    with _lock:
+        while True:
+            now = time.monotonic()
+            wait = None
+            for note_id, (action, payload, due) in _pending.items():
+                if note_id in _active:
+                    continue
+                # Skip the debounce when draining
+                if due <= now or _stopping:
+                    del _pending[note_id]
+                    _active.add(note_id)
+                    _statuses[note_id] = INDEXING
+                    return note_id, action, payload
+                wait = due - now if wait is None else min(wait, due - now)
+            if _stopping and not _pending:
+                return None
+            _lock.wait(wait)
+
+
+def _work():
+    while True:
+        job = _next_job()
+        if job is None:
+            return
+        note_id, action, payload = job
+        start = time.perf_counter()
+        try:
+            succeeded = action(payload) is not False
+        except Exception as e:
+            print(f"Error indexing note {note_id}: {e}")
+            succeeded = False
+        observe(
+            "noteflow_index_seconds",
+            time.perf_counter() - start,
+            help="Time to index or remove a note in the background",
+            action=action.__name__.strip("_"),
+            outcome="success" if succeeded else "failure",
+        )
+
+        with _lock:
+            _active.discard(note_id)
+            # A save that arrived while indexing keeps the note pending
+            if note_id not in _pending:
+                if succeeded:
+                    _statuses.pop(note_id, None)
+                    _recovered.pop(note_id, None)
+                else:
+                    _statuses[note_id] = FAILED
+            _lock.notify_all()
+
+
+def queue_stats():
+    """Returns the number of notes waiting to be indexed and being indexed"""
+    with _lock:
+        return {"pending": len(_pending), "active": len(_active)}
+
+
+def flush(timeout=None):
+    """Waits until every queued note has been indexed. Returns False on timeout."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _lock:
+        # Make debounced notes due immediately
+        for note_id, (action, payload, due) in list(_pending.items()):
+            _pending[note_id] = (action, payload, 0)
+        _lock.notify_all()
+        while _pending or _active:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            _lock.wait(remaining)
+    return True
+
+
+def shutdown(timeout=INDEX_DRAIN_TIMEOUT):
+    """Drains the queue and stops the workers"""
+    global _stopping
+    with _lock:
+        _stopping = True
+        _lock.notify_all()
+    deadline = time.monotonic() + timeout
+    for worker in _workers:
+        worker.join(max(0, deadline - time.monotonic()))
+    with _lock:
+        if _pending or _active:
+            print(f"Indexing queue shut down with {len(_pending) + len(_active)} notes not indexed")
+
+
+atexit.register(shutdown)
@@ -1,17 +1,13 @@
-import openai
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from services.clients import get_openai
+from services.upstream import call_upstream, upstream_slot
+from services.metrics import span, observe, record_usage
+import time
 
-openai.api_key = OPENAI_API_KEY
-
-client = OpenAI(api_key = OPENAI_API_KEY)
-
-
-def query_llm(query, context, prompt=None, model="gpt-4o", top_k = 3):
-    """Generate response from LLM using retrieved context."""
 
+def build_prompt(query, context, prompt=None):
+    """Builds the user prompt from the query and note context."""
     if prompt is None:
-        prompt = f'''
+        return f'''
         You are an intelligent assistant that answers questions **only** based on the provided context on the note.
         Do **not** use prior knowledge. If the note context does not contain enough information to answer the question, say:
         "Your note does not provide an answer to this question."
@@ -23,16 +19,51 @@ def query_llm(query, context, prompt=None, model="gpt-4o", top_k = 3):
         {query}
 
         '''
-    else:
-        prompt += f"{context}\n\n---\n\n{query}\n\n"
-    try:
-        response = client.chat.completions.create(
+    return prompt + f"{context}\n\n---\n\n{query}\n\n"
+
+
+def build_messages(query, context, prompt=None):
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": build_prompt(query, context, prompt)}
+    ]
+
+
+def query_llm(query, context, prompt=None, model="gpt-4o", top_k = 3):
+    """Generate response from LLM using retrieved context.
+
+    Transient failures are retried; anything else is raised to the caller.
+    """
+    with span("llm"):
+        response = call_upstream(
+            get_openai().chat.completions.create,
+            model = model,
+            messages=build_messages(query, context, prompt)
+        )
+    record_usage(model, getattr(response, "usage", None))
+    return response.choices[0].message.content
+
+
+def stream_llm(query, context, prompt=None, model="gpt-4o"):
+    """Generate response from LLM, yielding text as it arrives."""
+    start = time.perf_counter()
+    first_token = None
+    with span("llm"):
+        stream = call_upstream(
+            get_openai().chat.completions.create,
             model = model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": prompt}
-            ]
+            messages=build_messages(query, context, prompt),
+            stream=True,
+            # Adds a final chunk with the token counts
+            stream_options={"include_usage": True},
         )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error querying LLM: {e}"
\ No newline at end of file
+        # The stream keeps its connection busy until it's read to the end
+        with upstream_slot():
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    record_usage(model, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                        observe("noteflow_llm_first_token_seconds", first_token, help="Time until a streamed completion's first token", model=model)
+                    yield chunk.choices[0].delta.content
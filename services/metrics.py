@@ -0,0 +1,115 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context
+
+# Latency buckets in seconds, from cache hits up to long LLM completions
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+_counters = {}  # (name, labels) -> value
+_help = {}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name, value, help="", **labels):
+    """Records a value in a histogram"""
+    key = (name, _labels(labels))
+    with _lock:
+        _help.setdefault(name, (help, "histogram"))
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[0][i] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def increment(name, amount=1, help="", **labels):
+    """Adds to a counter"""
+    key = (name, _labels(labels))
+    with _lock:
+        _help.setdefault(name, (help, "counter"))
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+@contextmanager
+def span(stage):
+    """Times a stage of a request, e.g. with span("embedding"): ...
+
+    Durations go to the noteflow_stage_seconds histogram and, inside a request,
+    to its Server-Timing header.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        observe("noteflow_stage_seconds", duration, help="Time spent in each stage of a request", stage=stage)
+        if has_request_context():
+            spans = g.setdefault("spans", {})
+            spans[stage] = spans.get(stage, 0) + duration
+
+
+def record_usage(model, usage):
+    """Counts the tokens reported by an OpenAI response"""
+    if usage is None:
+        return
+    help = "Tokens used by LLM completions"
+    increment("noteflow_llm_tokens_total", usage.prompt_tokens or 0, help=help, model=model, type="prompt")
+    increment("noteflow_llm_tokens_total", usage.completion_tokens or 0, help=help, model=model, type="completion")
+
+
+def server_timing():
+    """Formats the current request's spans as a Server-Timing header value"""
+    spans = g.get("spans") or {}
+    return ", ".join(f"{stage};dur={duration * 1000:.1f}" for stage, duration in spans.items())
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def render(gauges=()):
+    """Renders every metric in the Prometheus text format.
+
+    gauges is a list of (name, help, labels dict, value) sampled at scrape time.
+    """
+    lines = []
+    with _lock:
+        names = sorted(_help)
+        for name in names:
+            help, kind = _help[name]
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(_counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+            else:
+                for (metric, labels), (buckets, total, count) in sorted(_histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, bucket in zip(BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {bucket}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+    seen = set()
+    for name, help, labels, value in gauges:
+        if name not in seen:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            seen.add(name)
+        lines.append(f"{name}{_format_labels(_labels(labels))} {value}")
+    return "\n".join(lines) + "\n"
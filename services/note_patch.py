@@ -0,0 +1,89 @@
+import copy
+
+# Note fields a patch may replace besides its blocks
+PATCHABLE_FIELDS = {"title", "description"}
+
+
+class PatchError(ValueError):
+    """A patch operation that can't be applied to the note"""
+
+
+def _index(content, block_id):
+    for i, block in enumerate(content):
+        if block.get("id") == block_id:
+            return i
+    raise PatchError(f"Block {block_id} not found")
+
+
+def _insert_at(content, after):
+    """Position just after the block with ID after, or the start if after is None"""
+    return 0 if after is None else _index(content, after) + 1
+
+
+def apply_ops(content, ops):
+    """Applies block operations to a note's content, returning (content, changes, text_changed).
+
+    Each operation is one of
+        {"op": "insert", "block": {...}, "after": block ID or None for the start}
+        {"op": "update", "id": block ID, "block": {fields to replace}}
+        {"op": "delete", "id": block ID}
+        {"op": "move", "id": block ID, "after": block ID or None for the start}
+
+    changes lists the IDs of inserted, updated, deleted and moved blocks, and
+    text_changed is whether the note's text or block order changed, i.e.
+    whether it needs re-indexing. Raises PatchError if an operation is invalid.
+    """
+    content = copy.deepcopy(content)
+    inserted, updated, deleted, moved = set(), set(), set(), set()
+    text_changed = False
+
+    for op in ops:
+        kind = op.get("op")
+        if kind == "insert":
+            block = op.get("block")
+            if not isinstance(block, dict) or not block.get("id"):
+                raise PatchError("Inserted blocks need an id")
+            if any(existing.get("id") == block["id"] for existing in content):
+                raise PatchError(f"Block {block['id']} already exists")
+            content.insert(_insert_at(content, op.get("after")), copy.deepcopy(block))
+            inserted.add(block["id"])
+            deleted.discard(block["id"])
+            text_changed = True
+        elif kind == "update":
+            fields = op.get("block")
+            if not isinstance(fields, dict):
+                raise PatchError("Updates need a block of fields")
+            block = content[_index(content, op.get("id"))]
+            if "id" in fields and fields["id"] != block["id"]:
+                raise PatchError("Block IDs can't be changed")
+            if "value" in fields and fields["value"] != block.get("value"):
+                text_changed = True
+            block.update(copy.deepcopy(fields))
+            updated.add(block["id"])
+        elif kind == "delete":
+            block_id = op.get("id")
+            del content[_index(content, block_id)]
+            if block_id in inserted:
+                inserted.discard(block_id)
+            else:
+                deleted.add(block_id)
+            updated.discard(block_id)
+            moved.discard(block_id)
+            text_changed = True
+        elif kind == "move":
+            block = content.pop(_index(content, op.get("id")))
+            content.insert(_insert_at(content, op.get("after")), block)
+            moved.add(block["id"])
+            text_changed = True
+        else:
+            raise PatchError(f"Unknown operation {kind}")
+
+    # Report each block once, by what happened to it overall
+    order = [block.get("id") for block in content]
+    changes = {
+        "inserted": [id for id in order if id in inserted],
+        "updated": [id for id in order if id in updated and id not in inserted],
+        "deleted": sorted(deleted),
+        "moved": [id for id in order if id in moved and id not in inserted],
+    }
+    return content, changes, text_changed
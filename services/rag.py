@@ -1,6 +1,14 @@
-from services.vectorstore_service import delete_note_vectors, save_note_vectors, retrieve_similar_notes
-from services.llm_service import query_llm
-from services.text_processing import chunk_notes
+from services.vectorstore_service import delete_note_vectors, save_note_vectors, retrieve_similar_notes, retrieve_across_notes
+from services.llm_service import query_llm, stream_llm
+from services.text_processing import chunk_notes, note_blocks
+from services.metrics import span
+
+CROSS_NOTE_PROMPT = '''You are an intelligent assistant that answers questions **only** based on the excerpts below, taken from several of the user's notes.
+Each excerpt starts with the title of its note in square brackets. Mention which notes your answer comes from.
+Do **not** use prior knowledge. If the excerpts do not contain enough information to answer the question, say:
+"Your notes do not provide an answer to this question."
+
+'''
 
 def rag_store(note_data):
     """ Embeds and stores a note in Pinecone """
@@ -9,22 +17,14 @@ def rag_store(note_data):
     if not note_id:
         return False
     
-    title = note_data["title"]
-    description = note_data["description"]
-    owner_email = note_data["owner"]
-    text_blocks = [
-        block["value"]
-        for block in note_data.get("content", [])
-        if block.get("value", "").strip()
-    ]
+    text_blocks, block_ids = note_blocks(note_data)
     
     # Chunking the document
-    note_chunks = chunk_notes(text_blocks, title, description, owner_email)
+    with span("chunking"):
+        note_chunks = list(chunk_notes(text_blocks, block_ids))
     
     # Create embeddings and store in Pinecone
-    save_note_vectors(note_id, note_chunks)
-
-    return True
+    return save_note_vectors(note_id, note_chunks, revision=note_data.get("revision", 0))
 
 def rag_remove(note_id):
     """Removes all document vectors from Pinecone by note ID."""
@@ -36,14 +36,31 @@ def rag_remove(note_id):
 
     return True
 
-def rag_query(query, note_id):
-    """Handles user query using RAG pipeline."""
-    if not query or not note_id:
+def rag_query(query, note_data):
+    """Handles user query using RAG pipeline, over a note as read from Firestore."""
+    if not query or not note_data.get("id"):
         return None
 
-    context = retrieve_similar_notes(query, note_id, top_k = 3)
+    context = retrieve_similar_notes(query, note_data)
     response = query_llm(query, context)
 
     return response
 
-        
\ No newline at end of file
+def rag_query_stream(query, note_data):
+    """Handles user query using RAG pipeline, yielding the answer as it's generated."""
+    context = retrieve_similar_notes(query, note_data)
+    return stream_llm(query, context)
+
+def rag_query_all(query, notes):
+    """Answers a query from several notes with one LLM call, returning (answer, sources)."""
+    context, sources = retrieve_across_notes(query, notes)
+    if not sources:
+        return "Your notes do not provide an answer to this question.", []
+    return query_llm(query, context, CROSS_NOTE_PROMPT), sources
+
+def rag_query_all_stream(query, notes):
+    """Like rag_query_all, but returns (answer generator, sources)."""
+    context, sources = retrieve_across_notes(query, notes)
+    if not sources:
+        return iter(["Your notes do not provide an answer to this question."]), []
+    return stream_llm(query, context, CROSS_NOTE_PROMPT), sources
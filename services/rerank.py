@@ -0,0 +1,95 @@
+import math
+from collections import Counter
+import numpy as np
+from config import RAG_MMR_LAMBDA, RAG_LEXICAL_WEIGHT
+from services.text_processing import tokenize
+
+# Post-retrieval stage between the vector query and build_context: candidates
+# are over-fetched, optionally reranked by how well their words match the query,
+# then picked with maximal marginal relevance so near-duplicate chunks don't
+# crowd out the rest of the context.
+
+K1 = 1.2
+B = 0.75
+
+
+def needs_values():
+    """Whether candidates need their vectors, which MMR compares"""
+    return RAG_MMR_LAMBDA < 1
+
+
+def _normalize(scores):
+    """Scales scores to [0, 1]"""
+    scores = np.asarray(scores, dtype=np.float32)
+    spread = scores.max() - scores.min() if len(scores) else 0
+    if spread <= 0:
+        return np.zeros_like(scores)
+    return (scores - scores.min()) / spread
+
+
+def lexical_scores(query, texts):
+    """BM25 scores of each text for the query, using the texts themselves as the corpus"""
+    terms = set(tokenize(query))
+    documents = [Counter(tokenize(text)) for text in texts]
+    if not terms or not documents:
+        return np.zeros(len(texts), dtype=np.float32)
+
+    lengths = np.array([sum(document.values()) for document in documents], dtype=np.float32)
+    average = lengths.mean() or 1
+    scores = np.zeros(len(texts), dtype=np.float32)
+    for term in terms:
+        frequencies = np.array([document[term] for document in documents], dtype=np.float32)
+        found = np.count_nonzero(frequencies)
+        if not found:
+            continue
+        idf = math.log(1 + (len(documents) - found + 0.5) / (found + 0.5))
+        scores += idf * frequencies * (K1 + 1) / (frequencies + K1 * (1 - B + B * lengths / average))
+    return scores
+
+
+def mmr(vectors, relevance, k, lambda_=RAG_MMR_LAMBDA):
+    """Greedily picks k indices, trading relevance against similarity to those already picked.
+
+    relevance is on the same scale as cosine similarity, so the two trade off
+    evenly. lambda_=1 ranks by relevance alone, lower values favour chunks
+    unlike the ones already chosen.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+    similarity = vectors @ vectors.T
+
+    k = min(k, len(vectors))
+    chosen = []
+    # Highest similarity of each candidate to any chosen one
+    redundancy = np.full(len(vectors), -np.inf, dtype=np.float32)
+    available = np.ones(len(vectors), dtype=bool)
+    for _ in range(k):
+        penalty = np.where(np.isinf(redundancy), 0, redundancy)
+        scores = lambda_ * relevance - (1 - lambda_) * penalty
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        chosen.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return chosen
+
+
+def select_chunks(query, matches, k):
+    """Orders up to k of the over-fetched matches for build_context, best first"""
+    matches = [match for match in matches if (match.get("metadata") or {}).get("text")]
+    if not matches:
+        return []
+
+    relevance = np.array([match["score"] for match in matches], dtype=np.float32)
+    if RAG_LEXICAL_WEIGHT > 0:
+        # Keyword matches move a candidate by up to RAG_LEXICAL_WEIGHT of the
+        # spread in vector scores, keeping relevance in cosine units for MMR
+        lexical = _normalize(lexical_scores(query, [match["metadata"]["text"] for match in matches]))
+        spread = float(relevance.max() - relevance.min()) or 1
+        relevance = relevance + RAG_LEXICAL_WEIGHT * spread * lexical
+
+    if needs_values() and all(match.get("values") is not None for match in matches):
+        order = mmr([match["values"] for match in matches], relevance, k)
+    else:
+        order = [int(i) for i in np.argsort(-relevance, kind="stable")[:k]]
+    return [matches[i] for i in order]
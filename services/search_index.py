@@ -0,0 +1,273 @@
+import bisect
+import math
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.transforms import Sentinel
+from config import SEARCH_INDEX_SYNC_SECONDS
+from services.access import access_list
+from services.clients import get_note_ref, get_firestore
+from services.text_processing import note_blocks, tokenize
+
+# In-memory full-text index of every note, ranked with BM25, in each process.
+# It's loaded from Firestore on the first search, and kept current by the notes
+# API for writes made through this process. Notes saved or shared through other
+# processes are caught up with before a search, at most every
+# SEARCH_INDEX_SYNC_SECONDS, by querying the notes whose updatedAt or
+# accessUpdatedAt is past the latest one seen. Deletions and revoked shares
+# can't be queried for, so results are rechecked in Firestore, see check_access.
+
+# Fields returned when listing notes, content is only fetched for a single note
+LIST_FIELDS = ["id", "title", "description", "owner", "permissions", "createdAt", "updatedAt", "revision"]
+# Fields read to index a note
+READ_FIELDS = LIST_FIELDS + ["content", "access", "accessUpdatedAt"]
+# Server timestamps of a note's last save and last share
+SYNC_FIELDS = ["updatedAt", "accessUpdatedAt"]
+
+# A term in the title counts as much as three in the body
+FIELD_WEIGHTS = {"title": 3, "description": 2, "content": 1}
+K1 = 1.2
+B = 0.75
+# Shortest last query term to match as a prefix, e.g. "lect" finds "lecture"
+MIN_PREFIX = 2
+
+_lock = threading.RLock()
+_postings = {}  # term -> {note_id: weighted term frequency}
+_docs = {}  # note_id -> {"terms": Counter, "length", "access": set, "revision", "summary"}
+_total_length = 0
+_terms = None  # sorted vocabulary for prefix matching, rebuilt when it's None
+_loaded = False
+_load_lock = threading.Lock()
+_removed = set()  # notes removed while loading, which the load mustn't bring back
+_synced_at = 0.0  # time.monotonic() of the last catch-up
+_last_change = None  # latest SYNC_FIELDS timestamp read from Firestore
+_sync_lock = threading.Lock()
+
+
+def _listing(note_data):
+    # Writes carry SERVER_TIMESTAMP placeholders, the local time is close enough
+    now = datetime.now(timezone.utc)
+    return {
+        field: now if isinstance(note_data[field], Sentinel) else note_data[field]
+        for field in LIST_FIELDS
+        if field in note_data
+    }
+
+
+def _unindex(note_id):
+    global _total_length, _terms
+    doc = _docs.pop(note_id, None)
+    if doc is None:
+        return
+    _total_length -= doc["length"]
+    for term in doc["terms"]:
+        postings = _postings[term]
+        del postings[note_id]
+        if not postings:
+            del _postings[term]
+            _terms = None
+
+
+def index_note(note_data):
+    """Adds or replaces a note in the index, ignoring revisions older than the indexed one"""
+    global _total_length, _terms
+    note_id = note_data.get("id")
+    if not note_id:
+        return
+
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        texts = note_blocks(note_data)[0] if field == "content" else [note_data.get(field) or ""]
+        for text in texts:
+            for token in tokenize(text):
+                terms[token] += weight
+
+    with _lock:
+        current = _docs.get(note_id)
+        if current is not None and current["revision"] > note_data.get("revision", 0):
+            return
+        _unindex(note_id)
+        for term, count in terms.items():
+            if term not in _postings:
+                _postings[term] = {}
+                _terms = None
+            _postings[term][note_id] = count
+        length = sum(terms.values())
+        _total_length += length
+        _docs[note_id] = {
+            "terms": terms,
+            "length": length,
+            "access": set(note_data.get("access") or access_list(note_data)),
+            "revision": note_data.get("revision", 0),
+            "summary": _listing(note_data),
+        }
+
+
+def update_access(note_id, permissions, access):
+    """Records a note's new permissions after sharing"""
+    with _lock:
+        doc = _docs.get(note_id)
+        if doc is not None:
+            doc["access"] = set(access)
+            doc["summary"]["permissions"] = permissions
+
+
+def remove_note(note_id):
+    with _lock:
+        _unindex(note_id)
+        if not _loaded:
+            _removed.add(note_id)
+
+
+def _read(query):
+    """Indexes the notes query returns, recording the latest change among them"""
+    global _last_change
+    for note in query.select(READ_FIELDS).stream():
+        data = note.to_dict()
+        data.setdefault("id", note.id)
+        with _lock:
+            if data["id"] in _removed:
+                continue
+            for field in SYNC_FIELDS:
+                changed = data.get(field)
+                if isinstance(changed, datetime) and (_last_change is None or changed > _last_change):
+                    _last_change = changed
+        index_note(data)
+
+
+def _load():
+    """Indexes every note in Firestore, once.
+
+    Notes are indexed one at a time, so edits made meanwhile aren't held up.
+    They apply on top, since index_note ignores older revisions.
+    """
+    global _loaded, _synced_at
+    if _loaded:
+        return
+    with _load_lock:
+        if _loaded:
+            return
+        _read(get_note_ref())
+        with _lock:
+            _removed.clear()
+            _loaded = True
+            _synced_at = time.monotonic()
+
+
+def _catch_up():
+    """Indexes the notes saved or shared since the last change seen, e.g. through other processes"""
+    global _synced_at
+    if time.monotonic() - _synced_at < SEARCH_INDEX_SYNC_SECONDS:
+        return
+    # One search catches up at a time, the others use the index as it is
+    if not _sync_lock.acquire(blocking=False):
+        return
+    try:
+        since = _last_change
+        if since is None:
+            # No note has been saved yet
+            _read(get_note_ref())
+        else:
+            for field in SYNC_FIELDS:
+                _read(get_note_ref().where(filter=FieldFilter(field, ">", since)))
+    except Exception as e:
+        print(f"Error catching up the search index: {e}")
+    finally:
+        _synced_at = time.monotonic()
+        _sync_lock.release()
+
+
+def reset():
+    """Empties the index, so the next search loads it from Firestore again"""
+    global _total_length, _terms, _loaded, _synced_at, _last_change
+    with _lock:
+        _postings.clear()
+        _docs.clear()
+        _removed.clear()
+        _total_length = 0
+        _terms = None
+        _loaded = False
+        _synced_at = 0.0
+        _last_change = None
+
+
+def _expand(term):
+    """All indexed terms starting with term"""
+    global _terms
+    if _terms is None:
+        _terms = sorted(_postings)
+    start = bisect.bisect_left(_terms, term)
+    end = bisect.bisect_left(_terms, term + "\uffff")
+    return _terms[start:end]
+
+
+def search(query, uid, limit=10, offset=0):
+    """Ranks the notes uid can access against query, returning (page of listings, total matches).
+
+    Every query term must match, the last one also as a prefix, so results
+    narrow as the user types.
+    """
+    _load()
+    _catch_up()
+    tokens = tokenize(query)
+    if not tokens:
+        return [], 0
+
+    with _lock:
+        count = len(_docs)
+        average = _total_length / count if count else 0
+        scores = None
+        for i, token in enumerate(tokens):
+            terms = [token]
+            if i == len(tokens) - 1 and len(token) >= MIN_PREFIX:
+                terms = _expand(token) or terms
+
+            term_scores = {}
+            for term in terms:
+                postings = _postings.get(term, {})
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for note_id, frequency in postings.items():
+                    doc = _docs[note_id]
+                    if uid not in doc["access"]:
+                        continue
+                    norm = frequency + K1 * (1 - B + B * doc["length"] / average)
+                    score = idf * frequency * (K1 + 1) / norm
+                    term_scores[note_id] = max(term_scores.get(note_id, 0), score)
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {note_id: score + term_scores[note_id] for note_id, score in scores.items() if note_id in term_scores}
+            if not scores:
+                return [], 0
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        page = [
+            {**_docs[note_id]["summary"], "score": score}
+            for note_id, score in ranked[offset:offset + limit]
+        ]
+        return page, len(ranked)
+
+
+def check_access(notes, uid):
+    """Keeps the listed notes uid can still access according to Firestore.
+
+    Shares changed and notes deleted through other processes never reach this
+    index, so results are rechecked with one read and the index is corrected.
+    """
+    if not notes:
+        return notes
+    refs = [get_note_ref().document(note["id"]) for note in notes]
+    allowed = set()
+    for snapshot in get_firestore().get_all(refs, field_paths=["owner", "permissions", "access"]):
+        if not snapshot.exists:
+            remove_note(snapshot.id)
+            continue
+        data = snapshot.to_dict()
+        access = data.get("access") or access_list(data)
+        update_access(snapshot.id, data.get("permissions"), access)
+        if uid in access:
+            allowed.add(snapshot.id)
+    return [note for note in notes if note["id"] in allowed]
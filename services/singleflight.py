@@ -0,0 +1,52 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_calls = {}  # key -> in-flight _Call
+_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """Lowercases a query and collapses its whitespace"""
+    return " ".join((query or "").lower().split())
+
+
+def flight_key(endpoint, revision, query="", model="gpt-4o"):
+    """Builds a key identifying identical requests, ignoring case and whitespace in the query"""
+    return (endpoint, revision, normalize_query(query), model)
+
+
+def single_flight(key, fn):
+    """Runs fn once for concurrent callers with the same key.
+
+    The first caller runs fn; callers arriving while it's in flight wait and
+    share its result, or its exception.
+    """
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = fn()
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call.done.set()
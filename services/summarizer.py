@@ -0,0 +1,87 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import SUMMARY_WORKERS, SUMMARY_CHUNK_SIZE, SUMMARY_CACHE_SIZE
+from services.llm_service import query_llm, stream_llm
+from services.text_processing import chunk_notes, note_blocks
+
+SUMMARY_PROMPT = "Summarize the note content above."
+SECTION_PROMPT = "Summarize this section of a longer note. Keep every key fact, term and definition."
+REDUCE_PROMPT = "The text above is a series of summaries of consecutive sections of one note. Combine them into a single summary of the whole note."
+
+_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summarizer")
+
+# sha256(model, prompt, content) -> summary
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def pack(texts, size=SUMMARY_CHUNK_SIZE):
+    """Joins consecutive texts into sections of up to size characters"""
+    sections, current, length = [], [], 0
+    for text in texts:
+        if current and length + len(text) + 1 > size:
+            sections.append("\n".join(current))
+            current, length = [], 0
+        current.append(text)
+        length += len(text) + 1
+    if current:
+        sections.append("\n".join(current))
+    return sections
+
+
+def note_sections(note_data, size=SUMMARY_CHUNK_SIZE):
+    """Splits a note's text into sections small enough to summarize in one prompt"""
+    text_blocks, block_ids = note_blocks(note_data)
+    chunks = chunk_notes(text_blocks, block_ids, chunk_size=size)
+    return pack([chunk.page_content for chunk in chunks], size)
+
+
+def summarize_text(prompt, content, model="gpt-4o"):
+    """Summarizes text with the LLM, reusing earlier summaries of identical text"""
+    key = hashlib.sha256(f"{model}\0{prompt}\0{content}".encode("utf-8")).hexdigest()
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    summary = query_llm(prompt, content, "", model=model)
+    if summary is None:
+        raise RuntimeError("Error generating summary")
+
+    with _cache_lock:
+        _cache[key] = summary
+        while len(_cache) > SUMMARY_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return summary
+
+
+def _final_inputs(note_data, model):
+    """Summarizes sections in parallel until what's left fits in one final prompt"""
+    sections = note_sections(note_data)
+    if len(sections) <= 1:
+        return SUMMARY_PROMPT, sections[0] if sections else ""
+
+    prompt = SECTION_PROMPT
+    while len(sections) > 1:
+        summaries = list(_executor.map(lambda section: summarize_text(prompt, section, model), sections))
+        reduced = pack(summaries)
+        if len(reduced) >= len(sections):
+            # Summaries aren't getting shorter, so combine what we have
+            return REDUCE_PROMPT, "\n".join(summaries)
+        sections = reduced
+        prompt = REDUCE_PROMPT
+    return REDUCE_PROMPT, sections[0]
+
+
+def summarize_note(note_data, model="gpt-4o"):
+    """Summarizes a note, map-reducing over sections if it's too long for one prompt"""
+    prompt, content = _final_inputs(note_data, model)
+    return summarize_text(prompt, content, model)
+
+
+def stream_summary(note_data, model="gpt-4o"):
+    """Like summarize_note, but streams the final summary as it's generated"""
+    prompt, content = _final_inputs(note_data, model)
+    return stream_llm(prompt, content, "", model=model)
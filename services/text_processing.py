@@ -1,29 +1,75 @@
+import hashlib
+import re
+from functools import lru_cache
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
-def chunk_notes(notes, title, description, owner_email, chunk_size=1500, overlap=100):
-    """Splits text into overlapping chunks."""
-    try:
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=overlap,
-        )
-
-        documents = []
-        for note in notes:
-            chunks = text_splitter.split_text(note)
-            for chunk in chunks:
-                document = Document(
-                    page_content=chunk,
-                    metadata={
-                        "title": title,
-                        "description": description,
-                        "owner_email": owner_email,
-                    }
-                )
-                documents.append(document)
-
-        return documents
-    except Exception as e:
-        print(f"Error chunking text: {e}")
-        return []
+# One in ANCHOR_INTERVAL blocks may end a chunk early, see chunk_notes
+ANCHOR_INTERVAL = 4
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text):
+    """Splits text into lowercase words for lexical search"""
+    return TOKEN.findall(text.lower()) if text else []
+
+def note_blocks(note_data):
+    """Returns the text and IDs of a note's non-empty content blocks."""
+    blocks = [
+        block
+        for block in note_data.get("content", [])
+        if block.get("value", "").strip()
+    ]
+    text_blocks = [block["value"] for block in blocks]
+    # Block IDs keep chunk IDs stable across edits to other blocks
+    block_ids = [block.get("id") or str(i) for i, block in enumerate(blocks)]
+    return text_blocks, block_ids
+
+@lru_cache(maxsize=None)
+def _splitter(chunk_size, overlap):
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
+
+def _is_anchor(block_id):
+    return hashlib.sha1(str(block_id).encode("utf-8")).digest()[0] % ANCHOR_INTERVAL == 0
+
+def _chunk(text, first_block, last_block):
+    return Document(page_content=text, metadata={"block_start": first_block, "block_end": last_block})
+
+def chunk_notes(blocks, block_ids=None, chunk_size=1500, overlap=100):
+    """Yields chunks of up to chunk_size characters, packing adjacent blocks together.
+
+    Only blocks longer than chunk_size are split, into overlapping pieces. Each
+    chunk records the IDs of its first and last block.
+
+    Chunks end at the size limit, or early at an anchor block once they're at
+    least half full. Anchors are picked by hashing block IDs, so chunk
+    boundaries don't depend on the rest of the note: editing one block changes
+    only the chunks around it, and the rest keep their IDs and embeddings.
+    """
+    if block_ids is None:
+        block_ids = [str(i) for i in range(len(blocks))]
+
+    current, current_ids, length = [], [], 0
+    for text, block_id in zip(blocks, block_ids):
+        if len(text) > chunk_size:
+            if current:
+                yield _chunk("\n".join(current), current_ids[0], current_ids[-1])
+                current, current_ids, length = [], [], 0
+            for piece in _splitter(chunk_size, overlap).split_text(text):
+                yield _chunk(piece, block_id, block_id)
+            continue
+
+        if current and length + 1 + len(text) > chunk_size:
+            yield _chunk("\n".join(current), current_ids[0], current_ids[-1])
+            current, current_ids, length = [], [], 0
+
+        length += len(text) + (1 if current else 0)
+        current.append(text)
+        current_ids.append(block_id)
+
+        if length >= chunk_size // 2 and _is_anchor(block_id):
+            yield _chunk("\n".join(current), current_ids[0], current_ids[-1])
+            current, current_ids, length = [], [], 0
+
+    if current:
+        yield _chunk("\n".join(current), current_ids[0], current_ids[-1])
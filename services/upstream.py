@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from config import (
+    UPSTREAM_CONCURRENCY,
+    UPSTREAM_POOL_SIZE,
+    UPSTREAM_TIMEOUT,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_BACKOFF_BASE,
+    UPSTREAM_BACKOFF_CAP,
+)
+from services.metrics import increment
+
+# Shared policy for every outbound OpenAI, embeddings and Pinecone call: one
+# keep-alive connection pool, per-call timeouts, a cap on concurrent calls, and
+# retries with exponential backoff and full jitter on 429s, 5xxs and
+# connection errors. Clients are built with their own retries disabled so that
+# this is the only retry loop.
+
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+_slots = threading.BoundedSemaphore(UPSTREAM_CONCURRENCY)
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Returns the pooled httpx client shared by the OpenAI SDK clients"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            import httpx
+
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=UPSTREAM_POOL_SIZE,
+                    max_keepalive_connections=UPSTREAM_POOL_SIZE,
+                    keepalive_expiry=60,
+                ),
+                timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=5),
+            )
+        return _http_client
+
+
+def _status(error):
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def is_retryable(error):
+    """Whether an upstream error is worth retrying"""
+    status = _status(error)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUSES
+    # No status means the request never got a response, e.g. a reset or timeout
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError)) or any(
+        word in name for word in ("Connection", "Timeout", "Protocol", "MaxRetry")
+    )
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt, error=None):
+    """Seconds to wait before a retry: full jitter, or the server's Retry-After if longer"""
+    delay = random.uniform(0, min(UPSTREAM_BACKOFF_CAP, UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+    retry_after = _retry_after(error) if error is not None else None
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, UPSTREAM_BACKOFF_CAP))
+    return delay
+
+
+@contextmanager
+def upstream_slot():
+    """Holds one of the UPSTREAM_CONCURRENCY slots, e.g. for the length of a stream"""
+    with _slots:
+        yield
+
+
+def call_upstream(fn, *args, **kwargs):
+    """Calls fn under the concurrency limit, retrying retryable errors with backoff"""
+    for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+        try:
+            with _slots:
+                return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == UPSTREAM_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = backoff(attempt, e)
+            increment("noteflow_upstream_retries_total", help="Retried upstream calls", error=type(e).__name__)
+            print(f"Upstream call failed ({e}), retrying in {delay:.2f}s")
+            # Sleep outside the slot so waiting retries don't starve other calls
+            time.sleep(delay)
+
+
+class UpstreamEmbeddings:
+    """Routes an embeddings model's calls through call_upstream"""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts):
+        return call_upstream(self.embeddings.embed_documents, texts)
+
+    def embed_query(self, text):
+        return call_upstream(self.embeddings.embed_query, text)
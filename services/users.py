@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from firebase_admin import auth
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+from services.clients import get_firebase_app
+
+# Most identifiers auth.get_users accepts in one call
+BATCH_SIZE = 100
+
+_cache = OrderedDict()  # lowercased email or uid -> ((uid, display name), expiry)
+_cache_lock = threading.Lock()
+
+
+def _key(identifier):
+    # Emails are case-insensitive in Firebase Auth, uids aren't
+    return identifier.lower() if "@" in identifier else identifier
+
+
+def _identifier(identifier):
+    if "@" in identifier:
+        return auth.EmailIdentifier(identifier)
+    return auth.UidIdentifier(identifier)
+
+
+def _cached(keys):
+    now = time.monotonic()
+    found = {}
+    with _cache_lock:
+        for key in keys:
+            entry = _cache.get(key)
+            if entry is None:
+                continue
+            if entry[1] > now:
+                _cache.move_to_end(key)
+                found[key] = entry[0]
+            else:
+                del _cache[key]
+    return found
+
+
+def _store(users):
+    expiry = time.monotonic() + USER_CACHE_TTL
+    with _cache_lock:
+        for user in users:
+            value = (user.uid, user.display_name)
+            for key in (user.uid, user.email.lower() if user.email else None):
+                if key is not None:
+                    _cache[key] = (value, expiry)
+                    _cache.move_to_end(key)
+        while len(_cache) > USER_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _lookup(identifiers):
+    return auth.get_users([_identifier(identifier) for identifier in identifiers]).users
+
+
+def resolve_users(identifiers):
+    """Maps emails and uids to (uid, display name), leaving out users that don't exist.
+
+    Uncached users are looked up with auth.get_users, in concurrent batches of
+    up to BATCH_SIZE, so any number of users takes about one round trip.
+    """
+    keys = {}
+    for identifier in identifiers:
+        try:
+            # Rejects malformed emails and uids before they can fail a whole batch
+            _identifier(identifier)
+        except ValueError:
+            continue
+        keys[identifier] = _key(identifier)
+
+    found = _cached(set(keys.values()))
+    missing = sorted({key for key in keys.values() if key not in found})
+    if missing:
+        get_firebase_app()
+        batches = [missing[i:i + BATCH_SIZE] for i in range(0, len(missing), BATCH_SIZE)]
+        if len(batches) == 1:
+            users = _lookup(batches[0])
+        else:
+            with ThreadPoolExecutor(max_workers=len(batches)) as executor:
+                users = [user for batch in executor.map(_lookup, batches) for user in batch]
+        _store(users)
+        for user in users:
+            found[user.uid] = (user.uid, user.display_name)
+            if user.email:
+                found[user.email.lower()] = (user.uid, user.display_name)
+
+    return {identifier: found[key] for identifier, key in keys.items() if key in found}
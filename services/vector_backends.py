@@ -0,0 +1,451 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import numpy as np
+from services.upstream import call_upstream
+
+
+class VectorBackend:
+    """Stores note vectors, one namespace per note ID.
+
+    Records are dicts of the form {"id", "values", "metadata"} and query
+    matches are dicts of the form {"id", "score", "metadata", "values"}.
+    """
+
+    def list_ids(self, namespace, prefix=None):
+        """Returns the set of vector IDs stored in a namespace, optionally only those starting with prefix"""
+        raise NotImplementedError
+
+    def upsert(self, namespace, records):
+        """Inserts or replaces records in a namespace"""
+        raise NotImplementedError
+
+    def delete(self, namespace, ids=None):
+        """Deletes the given IDs from a namespace, or the whole namespace if ids is None"""
+        raise NotImplementedError
+
+    def query(self, namespace, vector, top_k, filter=None, include_values=False):
+        """Returns the top-k matches by cosine similarity, best first"""
+        raise NotImplementedError
+
+    def fetch(self, namespace, ids):
+        """Returns {id: values} for the given IDs that exist in a namespace"""
+        raise NotImplementedError
+
+    def describe_stats(self):
+        """Returns backend statistics for debugging"""
+        raise NotImplementedError
+
+
+class PineconeBackend(VectorBackend):
+    UPSERT_BATCH_SIZE = 100  # Pinecone recommends at most 100 vectors per upsert
+    DELETE_BATCH_SIZE = 1000  # Pinecone accepts at most 1000 IDs per delete
+    FETCH_BATCH_SIZE = 1000  # and per fetch
+
+    def __init__(self, api_key, index_name, pool_size=None):
+        from pinecone import Pinecone
+
+        # Pinecone's own urllib3 retries stay on for connection setup; status
+        # retries and the concurrency limit come from call_upstream
+        kwargs = {"connection_pool_maxsize": pool_size} if pool_size else {}
+        self.index = Pinecone(api_key=api_key).Index(index_name, **kwargs)
+
+    def list_ids(self, namespace, prefix=None):
+        def list_all():
+            ids = set()
+            for page in self.index.list(prefix=prefix, namespace=namespace):
+                ids.update(page)
+            return ids
+
+        return call_upstream(list_all)
+
+    def upsert(self, namespace, records):
+        for i in range(0, len(records), self.UPSERT_BATCH_SIZE):
+            call_upstream(self.index.upsert, vectors=records[i:i + self.UPSERT_BATCH_SIZE], namespace=namespace)
+
+    def delete(self, namespace, ids=None):
+        if ids is None:
+            call_upstream(self.index.delete, namespace=namespace, delete_all=True)
+            return
+        ids = list(ids)
+        for i in range(0, len(ids), self.DELETE_BATCH_SIZE):
+            call_upstream(self.index.delete, ids=ids[i:i + self.DELETE_BATCH_SIZE], namespace=namespace)
+
+    def query(self, namespace, vector, top_k, filter=None, include_values=False):
+        response = call_upstream(
+            self.index.query,
+            vector=vector,
+            namespace=namespace,
+            top_k=top_k,
+            filter=filter,
+            include_values=include_values,
+            include_metadata=True,
+        )
+        return [
+            {
+                "id": match["id"],
+                "score": match["score"],
+                "metadata": match.get("metadata") or {},
+                "values": match.get("values") if include_values else None,
+            }
+            for match in response["matches"]
+        ]
+
+    def fetch(self, namespace, ids):
+        ids = list(ids)
+        vectors = {}
+        for i in range(0, len(ids), self.FETCH_BATCH_SIZE):
+            response = call_upstream(self.index.fetch, ids=ids[i:i + self.FETCH_BATCH_SIZE], namespace=namespace)
+            vectors.update({id: list(vector.values) for id, vector in response.vectors.items()})
+        return vectors
+
+    def describe_stats(self):
+        return call_upstream(self.index.describe_index_stats)
+
+
+def _compare(value, operator, operand):
+    if operator == "$exists":
+        return (value is not None) == operand
+    if operator == "$eq":
+        return value == operand
+    if operator == "$ne":
+        return value != operand
+    if operator == "$in":
+        return value in operand
+    if operator == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    if operator == "$lt":
+        return value < operand
+    if operator == "$lte":
+        return value <= operand
+    if operator == "$gt":
+        return value > operand
+    if operator == "$gte":
+        return value >= operand
+    raise ValueError(f"Unsupported filter operator {operator}")
+
+
+def matches_filter(metadata, filter):
+    """Evaluates a Pinecone-style metadata filter against one record's metadata"""
+    if not filter:
+        return True
+    for field, condition in filter.items():
+        if field == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif field == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(field)
+            if value is None and "$exists" not in condition:
+                # Like Pinecone, records missing a field never match conditions on it
+                return False
+            if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif metadata.get(field) != condition:
+            return False
+    return True
+
+
+class _Segment:
+    """Vectors for one partition of a namespace, as a contiguous float32 matrix of unit-length rows"""
+
+    def __init__(self, ids, metadata, vectors):
+        self.ids = ids
+        self.metadata = metadata
+        self.vectors = vectors
+        self.positions = {id: i for i, id in enumerate(ids)}
+
+
+class _Namespace:
+    """A namespace's segments by partition, and which partition holds each ID"""
+
+    def __init__(self):
+        self.segments = {}
+        self.owners = {}
+
+
+class LocalBackend(VectorBackend):
+    """In-process backend doing a vectorized cosine scan over each namespace.
+
+    Records are partitioned by their partition_field metadata, so a namespace
+    holding every note's chunks keeps each note's chunks in their own segment:
+    writing a note only rewrites its segment, and a query filtering on that
+    field only scans the segments it names. Records without the field share
+    one segment, which is all a per-note namespace has.
+
+    With a path, every segment is persisted as a raw float32 file that is
+    memory-mapped for queries, plus a JSON file of IDs and metadata.
+    Without a path, vectors only live in memory.
+    """
+
+    def __init__(self, path=None, partition_field="note_id"):
+        self.path = path
+        self.partition_field = partition_field
+        self.namespaces = {}
+        self.lock = threading.Lock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def _directory(self, namespace, partition=None):
+        # Note IDs aren't guaranteed to be safe file names
+        directory = os.path.join(self.path, hashlib.sha256(namespace.encode("utf-8")).hexdigest()[:32])
+        if partition is None:
+            return directory
+        return os.path.join(directory, hashlib.sha256(partition.encode("utf-8")).hexdigest()[:32])
+
+    def _partition(self, record):
+        value = (record.get("metadata") or {}).get(self.partition_field)
+        return value if isinstance(value, str) else None
+
+    @staticmethod
+    def _read_segment(directory):
+        """Returns a segment's manifest and its memory-mapped vectors, or None if it doesn't exist"""
+        manifest_path = os.path.join(directory, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        count, dimension = len(manifest["ids"]), manifest["dimension"]
+        if count:
+            vectors = np.memmap(
+                os.path.join(directory, manifest["vectors"]),
+                dtype=np.float32,
+                mode="r",
+                shape=(count, dimension),
+            )
+        else:
+            vectors = np.zeros((0, dimension), dtype=np.float32)
+        return manifest, _Segment(manifest["ids"], manifest["metadata"], vectors)
+
+    def _load(self, namespace):
+        """Returns a namespace from memory, loading its segments from disk if needed"""
+        if namespace in self.namespaces:
+            return self.namespaces[namespace]
+        if not self.path or not os.path.isdir(self._directory(namespace)):
+            return None
+
+        # Records without a partition live in the namespace's own directory, and
+        # each partition in a subdirectory of it
+        directory = self._directory(namespace)
+        loaded = _Namespace()
+        for segment_directory in [directory, *(os.path.join(directory, name) for name in sorted(os.listdir(directory)))]:
+            if os.path.isdir(segment_directory) and (read := self._read_segment(segment_directory)):
+                manifest, segment = read
+                partition = manifest.get("partition")
+                loaded.segments[partition] = segment
+                loaded.owners.update((id, partition) for id in segment.ids)
+        self.namespaces[namespace] = loaded
+        return loaded
+
+    def _write(self, namespace, loaded, partition, ids, metadata, vectors):
+        """Replaces one segment of a namespace, writing the vectors before the manifest that points at them"""
+        if not ids and partition is not None:
+            loaded.segments.pop(partition, None)
+            if self.path and os.path.isdir(self._directory(namespace, partition)):
+                shutil.rmtree(self._directory(namespace, partition))
+            return
+        if not self.path:
+            loaded.segments[partition] = _Segment(ids, metadata, vectors)
+            return
+
+        directory = self._directory(namespace, partition)
+
+        os.makedirs(directory, exist_ok=True)
+        manifest_path = os.path.join(directory, "manifest.json")
+
+        previous = None
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                previous = json.load(f)["vectors"]
+        generation = int(previous.split(".")[0].split("-")[1]) + 1 if previous else 0
+
+        vectors_name = f"vectors-{generation}.f32"
+        np.ascontiguousarray(vectors, dtype=np.float32).tofile(os.path.join(directory, vectors_name))
+
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump({
+                "namespace": namespace,
+                "partition": partition,
+                "ids": ids,
+                "metadata": metadata,
+                "dimension": vectors.shape[1],
+                "vectors": vectors_name,
+            }, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+        if previous:
+            os.remove(os.path.join(directory, previous))
+
+        # Map the new file rather than keeping the written copy in memory
+        loaded.segments[partition] = self._read_segment(directory)[1]
+
+    def _rewrite(self, namespace, loaded, partition, removed=(), records=(), vectors=None):
+        """Removes and then upserts records in one segment, leaving the others untouched"""
+        segment = loaded.segments.get(partition)
+        if segment is None:
+            ids, metadata, matrix = [], [], np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        else:
+            keep = [i for i, id in enumerate(segment.ids) if id not in removed]
+            ids = [segment.ids[i] for i in keep]
+            metadata = [segment.metadata[i] for i in keep]
+            matrix = np.array(segment.vectors[keep])
+
+        positions = {id: i for i, id in enumerate(ids)}
+        appended = []
+        for record, vector in zip(records, vectors if vectors is not None else []):
+            if record["id"] in positions:
+                matrix[positions[record["id"]]] = vector
+                metadata[positions[record["id"]]] = record.get("metadata") or {}
+            else:
+                positions[record["id"]] = len(ids)
+                ids.append(record["id"])
+                metadata.append(record.get("metadata") or {})
+                appended.append(vector)
+        if appended:
+            matrix = np.vstack([matrix, np.asarray(appended, dtype=np.float32)])
+
+        self._write(namespace, loaded, partition, ids, metadata, matrix)
+        for id in removed:
+            if loaded.owners.get(id) == partition:
+                del loaded.owners[id]
+        loaded.owners.update((record["id"], partition) for record in records)
+
+    def _segments(self, loaded, filter):
+        """Returns the segments that can hold records matching a filter"""
+        condition = (filter or {}).get(self.partition_field)
+        if isinstance(condition, str):
+            wanted = [condition]
+        elif isinstance(condition, dict) and set(condition) == {"$eq"}:
+            wanted = [condition["$eq"]]
+        elif isinstance(condition, dict) and set(condition) == {"$in"}:
+            wanted = condition["$in"]
+        else:
+            return list(loaded.segments.values())
+        # Records without a partition are checked too, as their metadata may still match
+        return [loaded.segments[p] for p in dict.fromkeys([None, *wanted]) if p in loaded.segments]
+
+    def list_ids(self, namespace, prefix=None):
+        with self.lock:
+            loaded = self._load(namespace)
+            if loaded is None:
+                return set()
+            return {id for id in loaded.owners if prefix is None or id.startswith(prefix)}
+
+    def upsert(self, namespace, records):
+        if not records:
+            return
+        new_vectors = np.asarray([record["values"] for record in records], dtype=np.float32)
+        norms = np.linalg.norm(new_vectors, axis=1, keepdims=True)
+        new_vectors /= np.where(norms == 0, 1, norms)
+
+        with self.lock:
+            loaded = self._load(namespace)
+            if loaded is None:
+                loaded = self.namespaces[namespace] = _Namespace()
+
+            by_partition = {}
+            for record, vector in zip(records, new_vectors):
+                by_partition.setdefault(self._partition(record), []).append((record, vector))
+
+            # Records whose partition changed are removed from their old segment
+            moved = {}
+            for partition, entries in by_partition.items():
+                for record, _ in entries:
+                    owner = loaded.owners.get(record["id"], partition)
+                    if owner != partition:
+                        moved.setdefault(owner, set()).add(record["id"])
+
+            for partition in by_partition.keys() | moved.keys():
+                entries = by_partition.get(partition, [])
+                self._rewrite(
+                    namespace,
+                    loaded,
+                    partition,
+                    removed=moved.get(partition, set()),
+                    records=[record for record, _ in entries],
+                    vectors=np.asarray([vector for _, vector in entries], dtype=np.float32) if entries else None,
+                )
+
+    def delete(self, namespace, ids=None):
+        with self.lock:
+            loaded = self._load(namespace)
+            if loaded is None:
+                return
+            if ids is None:
+                self.namespaces.pop(namespace, None)
+                if self.path:
+                    shutil.rmtree(self._directory(namespace))
+                return
+
+            by_partition = {}
+            for id in ids:
+                if id in loaded.owners:
+                    by_partition.setdefault(loaded.owners[id], set()).add(id)
+            for partition, removed in by_partition.items():
+                self._rewrite(namespace, loaded, partition, removed=removed)
+
+    def query(self, namespace, vector, top_k, filter=None, include_values=False):
+        with self.lock:
+            loaded = self._load(namespace)
+            segments = [segment for segment in self._segments(loaded, filter) if segment.ids] if loaded else []
+        if not segments:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        scores = np.concatenate([segment.vectors @ query for segment in segments])
+        rows = [(segment, i) for segment in segments for i in range(len(segment.ids))]
+
+        if filter:
+            mask = np.fromiter((matches_filter(segment.metadata[i], filter) for segment, i in rows), dtype=bool, count=len(rows))
+            scores = np.where(mask, scores, -np.inf)
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            {
+                "id": rows[i][0].ids[rows[i][1]],
+                "score": float(scores[i]),
+                "metadata": rows[i][0].metadata[rows[i][1]],
+                "values": rows[i][0].vectors[rows[i][1]].tolist() if include_values else None,
+            }
+            for i in top
+            if scores[i] != -np.inf
+        ]
+
+    def fetch(self, namespace, ids):
+        with self.lock:
+            loaded = self._load(namespace)
+            if loaded is None:
+                return {}
+            located = {id: loaded.segments[loaded.owners[id]] for id in ids if id in loaded.owners}
+        return {id: segment.vectors[segment.positions[id]].tolist() for id, segment in located.items()}
+
+    def describe_stats(self):
+        with self.lock:
+            if not self.path:
+                counts = {namespace: len(loaded.owners) for namespace, loaded in self.namespaces.items()}
+            else:
+                # Only namespaces that were used are loaded, so count from the manifests
+                counts = {}
+                for name in os.listdir(self.path):
+                    directory = os.path.join(self.path, name)
+                    for segment_directory in [directory, *(os.path.join(directory, sub) for sub in os.listdir(directory))]:
+                        manifest_path = os.path.join(segment_directory, "manifest.json")
+                        if os.path.exists(manifest_path):
+                            with open(manifest_path) as f:
+                                manifest = json.load(f)
+                            counts[manifest["namespace"]] = counts.get(manifest["namespace"], 0) + len(manifest["ids"])
+        return {
+            "namespaces": {namespace: {"vector_count": count} for namespace, count in counts.items()},
+            "total_vector_count": sum(counts.values()),
+        }
@@ -1,73 +1,324 @@
-from pinecone import Pinecone
-import time
-from langchain_pinecone import PineconeVectorStore
-from langchain_openai import OpenAIEmbeddings
-from config import PINECONE_API_KEY, OPENAI_API_KEY
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from firebase_admin import firestore
+from config import (
+    DEBUG_INDEX_STATS,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_MAX_CHUNKS,
+    CROSS_NOTE_FETCH_K,
+    CROSS_NOTE_CHUNKS_PER_NOTE,
+    CROSS_NOTE_CONCURRENCY,
+    CROSS_NOTE_TOKEN_BUDGET,
+    RAG_FETCH_K,
+)
+from services.clients import get_embeddings, get_vector_backend, get_note_ref, get_firestore, set_client
+from services.context_builder import build_context, pack_context
+from services.text_processing import note_blocks
+from services.vector_backends import matches_filter
+from services.rerank import select_chunks, needs_values
+from services.metrics import span
+from services import answer_cache
 
-INDEX_NAME = "noteflow"
+# Note fields recording the latest revision whose vectors are committed, and the
+# chunk IDs that revision removed. They live on the note so every instance sees them.
+INDEX_FIELDS = ["indexedRevision", "retiredChunks"]
 
-# Initialize Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
+# Every note's chunks are stored twice: in the note's own namespace, and in this
+# one as "<note ID>/<chunk ID>" with the note ID in their metadata, so a search
+# across many notes is a single query filtered by note ID.
+SHARED_NAMESPACE = "all-notes"
+# Note IDs per filtered query, well under Pinecone's limit on $in values
+MAX_FILTER_IDS = 1000
 
-index = pc.Index(INDEX_NAME)
+_query_executor = ThreadPoolExecutor(max_workers=CROSS_NOTE_CONCURRENCY, thread_name_prefix="vector-query")
 
-# Initialize OpenAI Embeddings
-embeddings = OpenAIEmbeddings(
-    model = "text-embedding-3-small",
-    openai_api_key = OPENAI_API_KEY,)
+def get_backend():
+    """Returns the configured vector backend, connecting on first use"""
+    return get_vector_backend()
+
+def set_backend(backend):
+    """Replaces the vector backend, e.g. with an in-memory LocalBackend for tests"""
+    set_client("vectors", backend)
+
+def embedding_cache_stats():
+    """Returns the embedding cache's hit/miss counters"""
+    return get_embeddings().stats()
 
 def delete_note_vectors(note_id):
-    """Deletes the note vectors from Pinecone"""
+    """Deletes the note vectors from the vector store"""
     try:
-        response = index.delete(namespace=note_id, delete_all=True)
-
-        if response == {}:
-            print(f"Successfully deleted vectors for note {note_id}")
-        else:
-            print(f"Namespace {note_id} not found or already empty.")
+        with span("vector_delete"):
+            get_backend().delete(note_id)
+        print(f"Successfully deleted vectors for note {note_id}")
     except Exception as e:
         if "Namespace not found" in str(e):
             print(f"Namespace {note_id} does not exist. Skipping deletion.")
+
+    shared_ids = get_shared_vector_ids(note_id)
+    if shared_ids:
+        with span("vector_delete"):
+            get_backend().delete(SHARED_NAMESPACE, [shared_id(note_id, id) for id in shared_ids])
     
 
-def save_note_vectors(note_id, note_chunks):
-    """Embeds and saves note chunks in Pinecone"""
-    # Seeing index stats before upsert
-    print("Index before upsert:")
-    print(pc.Index(INDEX_NAME).describe_index_stats())
-    print("\n")
+def chunk_id(document):
+    """Builds a stable vector ID from the chunk's block range and a hash of its content"""
+    digest = hashlib.sha256()
+    digest.update(document.page_content.encode("utf-8"))
+    # Metadata is stored alongside the vector, so changed metadata must also produce a new ID
+    digest.update(json.dumps(document.metadata, sort_keys=True).encode("utf-8"))
+    start, end = document.metadata.get("block_start"), document.metadata.get("block_end")
+    blocks = start if start == end else f"{start}..{end}"
+    return f"{blocks}#{digest.hexdigest()[:16]}"
+
+def get_note_vector_ids(note_id):
+    """Lists the IDs of the vectors stored for a note, or None if they can't be listed"""
     try:
-        delete_note_vectors(note_id)
-        
-        # Save note chunks in Pinecone
-        PineconeVectorStore.from_documents(
-            documents=note_chunks,
-            index_name=INDEX_NAME,
-            embedding=embeddings,
-            namespace=note_id,
-        )
-        
-        time.sleep(1) # Wait for the index to update, sometimes takes more than 1 second
-        print("Index after upsert:")
-        print(pc.Index(INDEX_NAME).describe_index_stats())
+        with span("vector_list"):
+            return get_backend().list_ids(note_id)
+    except Exception as e:
+        print(f"Error listing vectors for note {note_id}: {e}")
+        return None
+
+def shared_id(note_id, chunk_id):
+    return f"{note_id}/{chunk_id}"
+
+def get_shared_vector_ids(note_id):
+    """Lists the chunk IDs of a note's vectors in SHARED_NAMESPACE, or None if they can't be listed"""
+    prefix = shared_id(note_id, "")
+    try:
+        with span("vector_list"):
+            return {id[len(prefix):] for id in get_backend().list_ids(SHARED_NAMESPACE, prefix=prefix)}
+    except Exception as e:
+        print(f"Error listing shared vectors for note {note_id}: {e}")
+        return None
+
+def print_index_stats(label):
+    """Prints vector store stats when DEBUG_INDEX_STATS is set"""
+    if DEBUG_INDEX_STATS:
+        print(f"Index {label}:")
+        print(get_backend().describe_stats())
         print("\n")
+
+def committed_filter(note_data):
+    """Builds a metadata filter matching only the chunks of a note's latest committed revision.
+
+    note_data is the note, or at least its INDEX_FIELDS, as read from Firestore.
+    """
+    revision = note_data.get("indexedRevision")
+    if revision is None:
+        return None
+
+    current = {"revision": {"$lte": revision}}
+    if note_data.get("retiredChunks"):
+        # Retired chunks may still be visible while their deletion propagates
+        current["chunk_id"] = {"$nin": note_data["retiredChunks"]}
+    return {
+        "$or": [
+            current,
+            # Chunks stored before vectors were versioned
+            {"revision": {"$exists": False}},
+        ]
+    }
+
+def commit_revision(note_id, revision, retired, written=()):
+    """Records revision as the note's indexed revision, unless a newer one already is.
+
+    written are the chunk IDs stored for this revision. If a newer revision is
+    already indexed, they're retired instead, so queries never see them.
+    Returns True if it was recorded, False if a newer revision was, or None if
+    the note no longer exists.
+    """
+    ref = get_note_ref().document(note_id)
+
+    @firestore.transactional
+    def commit(transaction):
+        note = ref.get(INDEX_FIELDS, transaction=transaction)
+        if not note.exists:
+            return None
+        note_data = note.to_dict()
+        if note_data.get("indexedRevision", -1) > revision:
+            if written:
+                transaction.update(ref, {"retiredChunks": sorted(set(note_data.get("retiredChunks") or []) | set(written))})
+            return False
+        transaction.update(ref, {"indexedRevision": revision, "retiredChunks": retired})
+        return True
+
+    with span("firestore_write"):
+        return commit(get_firestore().transaction())
+
+def save_note_vectors(note_id, note_chunks, revision=0):
+    """Embeds and saves new note chunks, removing chunks that no longer exist.
+
+    New chunks are tagged with the note revision and only become visible to
+    queries once the revision is committed, so queries never mix revisions.
+    """
+    backend = get_backend()
+    print_index_stats("before upsert")
+    try:
+        documents = {chunk_id(document): document for document in note_chunks}
+
+        existing_ids = get_note_vector_ids(note_id)
+        existing_shared_ids = get_shared_vector_ids(note_id)
+        if existing_ids is None or existing_shared_ids is None:
+            # Can't diff against the index, so fall back to a full rebuild
+            delete_note_vectors(note_id)
+            existing_ids = existing_shared_ids = set()
+
+        new_ids = [id for id in documents if id not in existing_ids]
+        stale_ids = [id for id in existing_ids if id not in documents]
+        # Usually the same as new_ids, unless the note was indexed before SHARED_NAMESPACE existed
+        new_shared_ids = [id for id in documents if id not in existing_shared_ids]
+        stale_shared_ids = [id for id in existing_shared_ids if id not in documents]
+
+        # Only embed chunks that aren't already stored
+        to_embed = list(dict.fromkeys(new_ids + new_shared_ids))
+        if to_embed:
+            with span("embedding"):
+                vectors = dict(zip(to_embed, get_embeddings().embed_documents([documents[id].page_content for id in to_embed])))
+
+            def record(id, stored_id, **metadata):
+                return {
+                    "id": stored_id,
+                    "values": vectors[id],
+                    "metadata": {
+                        **documents[id].metadata,
+                        "text": documents[id].page_content,
+                        "chunk_id": id,
+                        "revision": revision,
+                        **metadata,
+                    },
+                }
+
+            with span("vector_upsert"):
+                if new_ids:
+                    backend.upsert(note_id, [record(id, id) for id in new_ids])
+                if new_shared_ids:
+                    backend.upsert(SHARED_NAMESPACE, [record(id, shared_id(note_id, id), note_id=note_id) for id in new_shared_ids])
+
+        # Commit before deleting, so queries switch to the new revision in one step
+        retired = sorted(set(stale_ids) | set(stale_shared_ids))
+        committed = commit_revision(note_id, revision, retired, written=to_embed)
+        if committed is None:
+            # The note was deleted while it was being indexed
+            print(f"Note {note_id} no longer exists, removing its vectors")
+            delete_note_vectors(note_id)
+            return True
+        if not committed:
+            # The stale chunks may belong to the newer revision, so keep them.
+            # The chunks just written are retired, and can go.
+            print(f"Skipping stale revision {revision} of note {note_id}")
+            with span("vector_delete"):
+                if new_ids:
+                    backend.delete(note_id, new_ids)
+                if new_shared_ids:
+                    backend.delete(SHARED_NAMESPACE, [shared_id(note_id, id) for id in new_shared_ids])
+            return True
+        # Answers about the previous revision no longer match what queries retrieve
+        answer_cache.invalidate(note_id)
+
+        if stale_ids:
+            with span("vector_delete"):
+                backend.delete(note_id, stale_ids)
+        if stale_shared_ids:
+            with span("vector_delete"):
+                backend.delete(SHARED_NAMESPACE, [shared_id(note_id, id) for id in stale_shared_ids])
+
+        print(f"Note {note_id}: embedded {len(to_embed)} chunks, removed {len(retired)}, kept {len(documents) - len(to_embed)}")
+        print_index_stats("after upsert")
+        return True
     except Exception as e:
-        print(f"Error saving note vectors: {e}")  
+        print(f"Error saving note vectors: {e}")
+        return False
     
-def retrieve_similar_notes(query, note_id, top_k=3):
-    """Retrieves top-k similar notes from Pinecone"""
-    # Compare query vector to all note vectors in Pinecone with same note_id
-    query_vector = embeddings.embed_query(query)
-    context = index.query(
-        vector=query_vector,
-        namespace=note_id,
-        top_k=top_k,
-        include_values=True,
-        include_metadata=True,
-    )
-
-    context_text = ""
-    for match in context['matches']:
-        context_text += match['metadata']['text']
-        
-    return context_text
\ No newline at end of file
+def with_values(namespace, matches):
+    """Adds their vectors to matches when MMR needs them.
+
+    Chunks were embedded through the embedding cache when they were indexed, so
+    their vectors are usually still there. Only the rest are fetched.
+    """
+    if not needs_values() or not matches:
+        return matches
+    vectors = get_embeddings().cached([(match.get("metadata") or {}).get("text") or "" for match in matches])
+    missing = [match["id"] for match, vector in zip(matches, vectors) if vector is None]
+    if missing:
+        try:
+            with span("vector_fetch"):
+                fetched = get_backend().fetch(namespace, missing)
+        except Exception as e:
+            # select_chunks ranks by relevance alone when vectors are missing
+            print(f"Error fetching vectors from {namespace}: {e}")
+            fetched = {}
+        vectors = [fetched.get(match["id"]) if vector is None else vector for match, vector in zip(matches, vectors)]
+    return [{**match, "values": vector} for match, vector in zip(matches, vectors)]
+
+def retrieve_similar_notes(query, note_data, token_budget=CONTEXT_TOKEN_BUDGET, max_chunks=CONTEXT_MAX_CHUNKS):
+    """Retrieves the note text most similar to the query, up to token_budget tokens.
+
+    note_data is the note as read from Firestore, including its INDEX_FIELDS.
+    """
+    note_id = note_data["id"]
+    # Compare query vector to all note vectors with same note_id
+    with span("embedding"):
+        query_vector = get_embeddings().embed_query(query)
+    with span("vector_query"):
+        # Over-fetch, so reranking has near-duplicates to skip
+        matches = get_backend().query(note_id, query_vector, max(RAG_FETCH_K, max_chunks), filter=committed_filter(note_data))
+
+    with span("rerank"):
+        matches = select_chunks(query, with_values(note_id, matches), max_chunks)
+    with span("context"):
+        # Chunks of consecutive blocks are joined, in the order of the note's blocks
+        _, block_ids = note_blocks(note_data)
+        block_order = {block_id: i for i, block_id in enumerate(block_ids)}
+        return build_context(matches, token_budget, ordered=True, block_order=block_order)
+
+def _query_shared(note_ids, query_vector, top_k):
+    filter = {"note_id": {"$in": note_ids}}
+    return get_backend().query(SHARED_NAMESPACE, query_vector, top_k, filter=filter)
+
+def retrieve_across_notes(query, notes, token_budget=CROSS_NOTE_TOKEN_BUDGET, top_k=CROSS_NOTE_FETCH_K, per_note=CROSS_NOTE_CHUNKS_PER_NOTE):
+    """Retrieves the text most similar to the query from several notes.
+
+    notes are the notes the caller can access, as read from Firestore with at
+    least their ID, title and INDEX_FIELDS. The query is embedded once and
+    matched against all of them in one query, or one per MAX_FILTER_IDS notes.
+    Returns (context, sources), where the context labels each passage with its
+    note's title and sources lists the notes the context quotes, best first,
+    as {"id", "title", "score"}.
+    """
+    notes = {note["id"]: note for note in notes}
+    if not notes:
+        return "", []
+
+    with span("embedding"):
+        query_vector = get_embeddings().embed_query(query)
+    ids = list(notes)
+    batches = [ids[i:i + MAX_FILTER_IDS] for i in range(0, len(ids), MAX_FILTER_IDS)]
+    with span("vector_query"):
+        results = list(_query_executor.map(lambda batch: _query_shared(batch, query_vector, top_k), batches))
+
+    matches, counts = [], {}
+    for match in sorted((match for result in results for match in result), key=lambda match: -match["score"]):
+        note_id = (match.get("metadata") or {}).get("note_id")
+        note = notes.get(note_id)
+        # Skip chunks of revisions that aren't committed yet, and cap each note's share
+        if note is None or not matches_filter(match["metadata"], committed_filter(note)):
+            continue
+        if counts.get(note_id, 0) >= per_note:
+            continue
+        counts[note_id] = counts.get(note_id, 0) + 1
+        matches.append({**match, "note_id": note_id})
+
+    titles = {note_id: note.get("title") or "Untitled" for note_id, note in notes.items()}
+    with span("rerank"):
+        matches = select_chunks(query, with_values(SHARED_NAMESPACE, matches), len(matches))
+    with span("context"):
+        context, used = pack_context(matches, token_budget, source=lambda match: titles[match["note_id"]], ordered=True)
+
+    sources = {}
+    for match in used:
+        best = sources.get(match["note_id"])
+        if best is None or match["score"] > best["score"]:
+            sources[match["note_id"]] = {"id": match["note_id"], "title": titles[match["note_id"]], "score": match["score"]}
+    return context, sorted(sources.values(), key=lambda source: -source["score"])
@@ -0,0 +1,59 @@
+"""Fixtures running the app against the in-process fakes in benchmarks/fakes.py.
+
+rag_response.py and response.py are manual scripts against a running server,
+not part of the suite.
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sets the environment the app needs before config is imported
+from benchmarks.e2e import install_fakes  # noqa: E402
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """Fresh fake clients with no latency, and empty in-process indexes and caches"""
+    from services import answer_cache, search_index
+    from services.indexing_queue import flush
+
+    fake_store = install_fakes(SimpleNamespace(firestore_latency=0, vector_latency=0, embedding_latency=0, llm_latency=0))
+    search_index.reset()
+    monkeypatch.setattr(answer_cache, "_cache", answer_cache.SemanticCache())
+    yield fake_store
+    flush()
+
+
+@pytest.fixture(scope="session")
+def app():
+    from api import create_app
+
+    # Blueprints can only be set up once per process
+    return create_app()
+
+
+@pytest.fixture
+def client(app, store):
+    return app.test_client()
+
+
+@pytest.fixture
+def llm_calls(store):
+    """Records the prompt of every chat completion sent to the fake OpenAI client"""
+    from services import clients
+
+    completions = clients.existing_client("openai").chat.completions
+    create = completions.create
+    prompts = []
+
+    def recording(*args, **kwargs):
+        prompts.append(kwargs["messages"][-1]["content"])
+        return create(*args, **kwargs)
+
+    # The fake is created afresh for each test, so there's nothing to restore
+    completions.create = recording
+    return prompts
@@ -0,0 +1,45 @@
+from benchmarks.e2e import make_note, HEADERS
+from services.access import access_list
+from services.clients import get_note_ref
+
+
+def stored_access(id):
+    return get_note_ref().document(id).get().to_dict()["access"]
+
+
+def listed(client, uid):
+    response = client.get("/notes", headers={"Authorization": f"Bearer token-{uid}"})
+    return [note["id"] for note in response.get_json()["results"]]
+
+
+def test_access_list():
+    note = {"owner": "owner", "permissions": {"view": ["viewer", "editor"], "edit": ["editor"], "global": "view"}}
+    assert access_list(note) == ["editor", "owner", "viewer"]
+    assert access_list({"owner": "owner"}) == ["owner"]
+
+
+def test_add_and_put_store_the_access_list(client):
+    note = make_note(1, 1)
+    note["permissions"]["view"] = ["viewer"]
+    id = client.post("/notes", json=note, headers=HEADERS).get_json()["id"]
+    assert stored_access(id) == ["owner", "viewer"]
+
+    note.update(id=id, access=["intruder"])
+    note["permissions"]["edit"] = ["editor"]
+    client.put(f"/notes/{id}", json=note, headers=HEADERS)
+    assert stored_access(id) == ["editor", "owner", "viewer"]
+    assert listed(client, "editor") == [id]
+    assert listed(client, "intruder") == []
+
+
+def test_share_rewrites_the_access_list(client):
+    id = client.post("/notes", json=make_note(1, 1), headers=HEADERS).get_json()["id"]
+    assert listed(client, "alice") == []
+
+    client.post(f"/notes/{id}/share", json={"user": {"alice@example.com": "view", "missing@example.com": "edit"}, "global": None}, headers=HEADERS)
+    assert stored_access(id) == ["alice", "owner"]
+    assert listed(client, "alice") == [id]
+
+    client.post(f"/notes/{id}/share", json={"user": {}, "global": None}, headers=HEADERS)
+    assert stored_access(id) == ["owner"]
+    assert listed(client, "alice") == []
@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+
+from benchmarks.e2e import make_note, HEADERS
+from services import answer_cache, indexing_queue
+from services.indexing_queue import flush
+from services.answer_cache import SemanticCache
+
+SCOPE = ("search", "note", 1)
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_returns_answers_to_similar_questions():
+    cache = SemanticCache(max_entries=10, ttl=60, threshold=0.9)
+    cache.store(SCOPE, unit(1, 0, 0), "answer")
+    assert cache.lookup(SCOPE, unit(1, 0.1, 0)) == "answer"
+    assert cache.lookup(SCOPE, unit(1, 1, 0)) is None
+
+
+def test_picks_the_most_similar_question():
+    cache = SemanticCache(max_entries=10, ttl=60, threshold=0.5)
+    cache.store(SCOPE, unit(1, 0, 0), "x")
+    cache.store(SCOPE, unit(0, 1, 0), "y")
+    assert cache.lookup(SCOPE, unit(0.2, 1, 0)) == "y"
+
+
+def test_answers_are_scoped():
+    cache = SemanticCache(max_entries=10, ttl=60, threshold=0.9)
+    cache.store(SCOPE, unit(1, 0), "answer")
+    assert cache.lookup(("search", "note", 2), unit(1, 0)) is None
+    assert cache.lookup(("search", "other", 1), unit(1, 0)) is None
+
+
+def test_evicts_least_recently_used():
+    cache = SemanticCache(max_entries=2, ttl=60, threshold=0.9)
+    cache.store(SCOPE, unit(1, 0, 0), "x")
+    cache.store(SCOPE, unit(0, 1, 0), "y")
+    assert cache.lookup(SCOPE, unit(1, 0, 0)) == "x"
+    cache.store(SCOPE, unit(0, 0, 1), "z")
+    assert cache.lookup(SCOPE, unit(0, 1, 0)) is None
+    assert cache.lookup(SCOPE, unit(1, 0, 0)) == "x"
+    assert cache.stats()["entries"] == 2
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = SemanticCache(max_entries=10, ttl=60, threshold=0.9)
+    cache.store(SCOPE, unit(1, 0), "answer")
+    now[0] += 59
+    assert cache.lookup(SCOPE, unit(1, 0)) == "answer"
+    now[0] += 2
+    assert cache.lookup(SCOPE, unit(1, 0)) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_drops_a_notes_answers():
+    cache = SemanticCache(max_entries=10, ttl=60, threshold=0.9)
+    cache.store(("search", "note", 1), unit(1, 0), "old")
+    cache.store(("search", "note", 2), unit(1, 0), "new")
+    cache.store(("search", "other", 1), unit(1, 0), "other")
+    cache.invalidate("note")
+    assert cache.lookup(("search", "note", 2), unit(1, 0)) is None
+    assert cache.lookup(("search", "other", 1), unit(1, 0)) == "other"
+
+
+def test_grows_past_its_initial_capacity():
+    cache = SemanticCache(max_entries=100, ttl=60, threshold=0.99)
+    vectors = np.eye(10, dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        cache.store(SCOPE, vector, str(i))
+    assert [cache.lookup(SCOPE, vector) for vector in vectors] == [str(i) for i in range(10)]
+
+
+def test_disabled_when_size_is_zero():
+    cache = SemanticCache(max_entries=0, ttl=60, threshold=0.9)
+    cache.store(SCOPE, unit(1, 0), "answer")
+    assert cache.lookup(SCOPE, unit(1, 0)) is None
+
+
+def test_stats():
+    cache = SemanticCache(max_entries=10, ttl=60, threshold=0.9)
+    cache.store(SCOPE, unit(1, 0), "answer")
+    cache.lookup(SCOPE, unit(1, 0))
+    cache.lookup(SCOPE, unit(0, 1))
+    cache.lookup(("chat", None, "question"), unit(1, 0))
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 1, "hit_rate": 1 / 3}
+
+
+def test_cached_answer_computes_once(store):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "answer"
+
+    assert answer_cache.cached_answer(SCOPE, "What is an eigenvalue?", compute) == "answer"
+    assert answer_cache.cached_answer(SCOPE, "What is an eigenvalue?", compute) == "answer"
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_reindexing_a_note_invalidates_its_answers(client, llm_calls, monkeypatch, stream):
+    # Keep edits queued until flush(), so searches see the note before it's reindexed
+    monkeypatch.setattr(indexing_queue, "INDEX_DEBOUNCE_SECONDS", 60)
+    note = make_note(1, 1)
+    note["content"][0]["value"] = "OLD TEXT about eigenvalues"
+    id = client.post("/notes", json=note, headers=HEADERS).get_json()["id"]
+    flush()
+
+    def search():
+        response = client.get(f"/notes/{id}/search", query_string={"q": "eigenvalues", "stream": str(stream).lower()}, headers=HEADERS)
+        return response.get_data(as_text=True)
+
+    search()
+    search()
+    assert len(llm_calls) == 1
+    assert "OLD TEXT" in llm_calls[0]
+
+    note["id"] = id
+    note["content"][0]["value"] = "NEW TEXT about eigenvalues"
+    client.put(f"/notes/{id}", json=note, headers=HEADERS)
+    # Until it's reindexed, answers come from the old text
+    search()
+    assert all("NEW TEXT" not in prompt for prompt in llm_calls)
+
+    flush()
+    calls = len(llm_calls)
+    search()
+    assert len(llm_calls) == calls + 1
+    assert "NEW TEXT" in llm_calls[-1]
+    search()
+    assert len(llm_calls) == calls + 1
+
+
+
+def test_chat_only_reuses_answers_to_the_same_message(client, llm_calls, monkeypatch):
+    # Treat every question as similar, as short messages differing in one word can be
+    monkeypatch.setattr(answer_cache, "embed_question", lambda query: unit(1, 0))
+
+    def chat(message):
+        return client.post("/ai/chat", json={"message": message}).get_json()["response"]
+
+    chat("What is 2 + 2?")
+    chat("what is 2 +  2? ")
+    assert len(llm_calls) == 1
+    chat("What is 2 + 3?")
+    assert "What is 2 + 3?" in llm_calls[-1]
+    assert len(llm_calls) == 2
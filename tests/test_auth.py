@@ -0,0 +1,48 @@
+import pytest
+from firebase_admin import auth as firebase_auth
+
+from api import auth
+
+
+@pytest.fixture
+def verifications(store, monkeypatch):
+    """Counts the tokens verified with Firebase, which expire at time 1000"""
+    verified = []
+
+    def verify_id_token(id_token, *args, **kwargs):
+        verified.append(id_token)
+        return {"uid": id_token, "exp": 1000}
+
+    monkeypatch.setattr(firebase_auth, "verify_id_token", verify_id_token)
+    return verified
+
+
+@pytest.fixture
+def now(monkeypatch):
+    clock = [900.0]
+    monkeypatch.setattr(auth.time, "time", lambda: clock[0])
+    return clock
+
+
+def test_reuses_a_verified_token_until_it_expires(verifications, now):
+    assert auth.verify_token("reused")["uid"] == "reused"
+    now[0] = 999
+    assert auth.verify_token("reused")["uid"] == "reused"
+    assert verifications == ["reused"]
+
+    now[0] = 1000
+    auth.verify_token("reused")
+    assert verifications == ["reused", "reused"]
+
+
+def test_keeps_the_most_recently_used_tokens(verifications, now, monkeypatch):
+    monkeypatch.setattr(auth, "AUTH_CACHE_SIZE", 2)
+    for token in ("first", "second", "first", "third", "first", "second"):
+        auth.verify_token(token)
+    # "second" was the least recently used when "third" was added
+    assert verifications == ["first", "second", "third", "second"]
+
+
+def test_rejects_missing_and_invalid_tokens(client):
+    assert client.get("/notes").status_code == 401
+    assert client.get("/notes", headers={"Authorization": "Bearer invalid"}).status_code == 401
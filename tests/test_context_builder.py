@@ -0,0 +1,52 @@
+from services.context_builder import build_context, merge_overlap, pack_context
+
+ORDER = {"a": 0, "b": 1, "c": 2, "d": 3}
+
+
+def match(text, start, end=None, score=1.0):
+    return {"score": score, "metadata": {"text": text, "block_start": start, "block_end": end or start}}
+
+
+def test_merge_overlap():
+    first = "The eigenvalues of a matrix are the roots of its characteristic polynomial."
+    second = "roots of its characteristic polynomial. They may be complex."
+    assert merge_overlap(first, second) == first + " They may be complex."
+    assert merge_overlap(first, "Unrelated text") is None
+
+
+def test_joins_overlapping_pieces_of_a_block():
+    first = "x" * 50 + " the shared overlap between pieces"
+    second = "the shared overlap between pieces " + "y" * 50
+    context = build_context([match(first, "b"), match(second, "b", score=0.5)], 1000)
+    assert context == "x" * 50 + " the shared overlap between pieces " + "y" * 50
+
+
+def test_joins_chunks_of_consecutive_blocks_in_block_order():
+    matches = [match("Third", "c", "d", score=0.9), match("First", "a"), match("Second", "b", score=0.8)]
+    assert build_context(matches, 1000, block_order=ORDER) == "First\nSecond\nThird"
+    # Without the block order, they stay separate passages
+    assert build_context(matches, 1000) == "First\n\nThird\n\nSecond"
+
+
+def test_doesnt_join_chunks_with_blocks_between():
+    matches = [match("First", "a"), match("Third", "c", score=0.5)]
+    assert build_context(matches, 1000, block_order=ORDER) == "First\n\nThird"
+
+
+def test_doesnt_join_chunks_of_different_sources():
+    matches = [{**match("First", "a"), "note": "one"}, {**match("Second", "b", score=0.5), "note": "two"}]
+    context = build_context(matches, 1000, source=lambda m: m["note"], block_order=ORDER)
+    assert context == "[one]\nFirst\n\n[two]\nSecond"
+
+
+def test_fills_the_budget_best_first():
+    matches = [match("word " * 40, "a", score=0.9), match("word " * 200, "b", score=0.8), match("short", "d", score=0.1)]
+    context, used = pack_context(matches, 100)
+    # The second match doesn't fit, but the third does
+    assert used == [matches[0], matches[2]]
+    assert context.endswith("short")
+
+
+def test_always_includes_the_best_match():
+    matches = [match("word " * 500, "a")]
+    assert build_context(matches, 10) == "word " * 500
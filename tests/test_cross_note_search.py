@@ -0,0 +1,88 @@
+from benchmarks.e2e import make_note, HEADERS
+from services.clients import get_note_ref
+from services.indexing_queue import flush
+from services.vectorstore_service import SHARED_NAMESPACE, get_backend, retrieve_across_notes
+
+QUESTION = "What did we cover about spectral decomposition"
+
+
+def add(client, note, headers=HEADERS):
+    return client.post("/notes", json=note, headers=headers).get_json()["id"]
+
+
+def one_block_note(title, text, owner="owner"):
+    note = make_note(0, 1)
+    note.update(title=title, owner=owner)
+    note["content"][0]["value"] = text
+    return note
+
+
+def search(client, query=QUESTION, headers=HEADERS):
+    return client.get("/notes/search", query_string={"q": query}, headers=headers).get_json()
+
+
+def test_searches_every_accessible_note(client):
+    # The fake embeddings only match identical text, and the match is the oldest of many notes
+    match = add(client, one_block_note("Old lecture", QUESTION))
+    for i in range(60):
+        add(client, make_note(i, 2))
+    flush()
+
+    body = search(client)
+    assert body["success"]
+    assert body["sources"][0]["id"] == match
+
+
+def test_only_searches_notes_shared_with_the_caller(client):
+    private = add(client, one_block_note("Private", QUESTION, owner="bob"))
+    flush()
+    assert search(client)["sources"] == []
+
+    # Shared, then revoked directly in Firestore as another instance would
+    get_note_ref().document(private).update({"access": ["bob", "owner"]})
+    assert [source["id"] for source in search(client)["sources"]] == [private]
+    get_note_ref().document(private).update({"access": ["bob"]})
+    assert search(client)["sources"] == []
+
+
+def test_sources_only_list_quoted_notes(client):
+    for i in range(5):
+        add(client, make_note(i, 10))
+    flush()
+    notes = [{**note.to_dict(), "id": note.id} for note in get_note_ref().stream()]
+
+    context, sources = retrieve_across_notes("eigenvalues", notes, token_budget=200)
+    assert sources
+    assert len(sources) < len(notes)
+    for source in sources:
+        assert f"[{source['title']}]" in context
+
+
+def test_skips_uncommitted_revisions(client):
+    id = add(client, one_block_note("Lecture", QUESTION))
+    flush()
+
+    note = one_block_note("Lecture", "Rewritten " + QUESTION)
+    note["id"] = id
+    client.put(f"/notes/{id}", json=note, headers=HEADERS)
+    # Queries stay on the committed revision until the new one is indexed
+    note = get_note_ref().document(id).get().to_dict()
+    context, _ = retrieve_across_notes(QUESTION, [{**note, "id": id}])
+    assert "Rewritten" not in context
+
+    flush()
+    note = get_note_ref().document(id).get().to_dict()
+    context, _ = retrieve_across_notes("Rewritten " + QUESTION, [{**note, "id": id}])
+    assert "Rewritten" in context
+
+
+def test_deleting_a_note_removes_its_shared_vectors(client):
+    id = add(client, make_note(1, 3))
+    kept = add(client, make_note(2, 3))
+    flush()
+    assert get_backend().list_ids(SHARED_NAMESPACE, prefix=f"{id}/")
+
+    client.delete(f"/notes/{id}", headers=HEADERS)
+    flush()
+    assert get_backend().list_ids(SHARED_NAMESPACE, prefix=f"{id}/") == set()
+    assert get_backend().list_ids(SHARED_NAMESPACE, prefix=f"{kept}/")
@@ -0,0 +1,60 @@
+from array import array
+
+import pytest
+
+from benchmarks.fakes import FakeEmbeddings
+from services.embedding_cache import CachedEmbeddings
+
+
+@pytest.fixture
+def model():
+    return FakeEmbeddings()
+
+
+def test_embeds_each_text_once(model):
+    cache = CachedEmbeddings(model, "fake")
+    first = cache.embed_documents(["a", "b", "a"])
+    assert model.calls == 1
+    assert cache.embed_documents(["b", "a"]) == [first[1], first[0]]
+    assert model.calls == 1
+
+
+def test_keeps_vectors_as_float32(model):
+    cache = CachedEmbeddings(model, "fake")
+    cache.embed_documents(["a"])
+    cache.embed_documents(["a"])
+    stored, = cache.memory.values()
+    assert isinstance(stored, array) and stored.typecode == "f"
+    # Callers still get lists
+    assert isinstance(cache.embed_query("a"), list)
+
+
+def test_evicts_least_recently_used(model):
+    cache = CachedEmbeddings(model, "fake", max_entries=2)
+    cache.embed_documents(["a", "b"])
+    cache.embed_documents(["a"])
+    cache.embed_documents(["c"])
+    assert cache.cached(["a", "b", "c"])[1] is None
+    assert len(cache.memory) == 2
+
+
+def test_survives_restarts_on_disk(model, tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    vector = CachedEmbeddings(model, "fake", path=path).embed_query("a")
+    cache = CachedEmbeddings(model, "fake", path=path)
+    assert cache.embed_query("a") == vector
+    assert model.calls == 1
+    assert cache.stats()["disk_hits"] == 1
+    # Another model's vectors aren't reused
+    CachedEmbeddings(model, "other", path=path).embed_query("a")
+    assert model.calls == 2
+
+
+def test_cached_lookups_dont_count_towards_stats(model):
+    cache = CachedEmbeddings(model, "fake")
+    cache.embed_documents(["a", "b"])
+    cache.embed_query("a")
+    cache.cached(["a", "b", "c"] * 10)
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["misses"]) == (1, 2)
+    assert stats["hit_rate"] == 1 / 3
@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.e2e import make_note, HEADERS
+from services import indexing_queue
+from services.clients import get_note_ref
+from services.indexing_queue import flush
+
+
+def status(client, id):
+    return client.get(f"/notes/{id}", headers=HEADERS).get_json()["indexStatus"]
+
+
+def saved_elsewhere(age):
+    """A note saved by another instance age ago, whose indexing never finished here"""
+    note = make_note(1, 2)
+    note.update(id="elsewhere", revision=2, indexedRevision=1, updatedAt=datetime.now(timezone.utc) - age)
+    get_note_ref().document("elsewhere").set(note)
+    return "elsewhere"
+
+
+def test_saved_notes_become_current(client):
+    id = client.post("/notes", json=make_note(1, 2), headers=HEADERS).get_json()["id"]
+    flush()
+    assert status(client, id) == "current"
+    assert get_note_ref().document(id).get().to_dict()["indexedRevision"] == 1
+
+
+def test_status_comes_from_the_note(client):
+    id = saved_elsewhere(timedelta(seconds=1))
+    # Another instance may still be indexing it, so it isn't queued here
+    assert status(client, id) == "pending"
+    assert indexing_queue.queue_stats() == {"pending": 0, "active": 0}
+
+
+def test_lost_jobs_are_queued_again(client):
+    id = saved_elsewhere(timedelta(hours=1))
+    assert status(client, id) == "pending"
+    flush()
+    assert get_note_ref().document(id).get().to_dict()["indexedRevision"] == 2
+    assert status(client, id) == "current"
+
+
+def test_failed_jobs_are_retried(client, monkeypatch):
+    monkeypatch.setattr(indexing_queue, "INDEX_RECOVER_SECONDS", 0)
+    stores = []
+    store = indexing_queue._store
+
+    def failing_once(note_data):
+        stores.append(note_data["revision"])
+        return len(stores) > 1 and store(note_data)
+
+    monkeypatch.setattr(indexing_queue, "_store", failing_once)
+    id = client.post("/notes", json=make_note(1, 2), headers=HEADERS).get_json()["id"]
+    flush()
+    assert status(client, id) == "pending"
+    flush()
+    assert status(client, id) == "current"
+    assert stores == [1, 1]
+
+
+@pytest.mark.parametrize("block, text_changed", [({"style": {"align": "center"}}, False), ({"value": "Edited"}, True)])
+def test_style_edits_dont_need_indexing(client, block, text_changed, monkeypatch):
+    id = client.post("/notes", json=make_note(1, 2), headers=HEADERS).get_json()["id"]
+    flush()
+    monkeypatch.setattr(indexing_queue, "INDEX_DEBOUNCE_SECONDS", 60)
+    client.patch(f"/notes/{id}", json={"baseRevision": 1, "ops": [{"op": "update", "id": "block-0", "block": block}]}, headers=HEADERS)
+    assert status(client, id) == ("pending" if text_changed else "current")
@@ -0,0 +1,129 @@
+import pytest
+
+from benchmarks.e2e import make_note, HEADERS
+from services.note_patch import apply_ops, PatchError
+
+
+def blocks(*ids):
+    return [{"id": id, "type": "text", "value": f"Text of {id}", "style": {"align": "left"}} for id in ids]
+
+
+def ids(content):
+    return [block["id"] for block in content]
+
+
+def test_insert_then_delete_reports_nothing():
+    content, changes, text_changed = apply_ops(blocks("a", "b"), [
+        {"op": "insert", "block": {"id": "c", "value": "New"}, "after": "a"},
+        {"op": "delete", "id": "c"},
+    ])
+    assert ids(content) == ["a", "b"]
+    assert changes == {"inserted": [], "updated": [], "deleted": [], "moved": []}
+    # The note went through an edit, so it's still re-indexed
+    assert text_changed
+
+
+def test_delete_then_insert_reports_insert_only():
+    content, changes, _ = apply_ops(blocks("a", "b"), [
+        {"op": "delete", "id": "b"},
+        {"op": "insert", "block": {"id": "b", "value": "Again"}, "after": None},
+    ])
+    assert ids(content) == ["b", "a"]
+    assert changes["inserted"] == ["b"]
+    assert changes["deleted"] == []
+
+
+def test_update_then_delete_reports_delete():
+    _, changes, _ = apply_ops(blocks("a", "b"), [
+        {"op": "update", "id": "a", "block": {"value": "Changed"}},
+        {"op": "delete", "id": "a"},
+    ])
+    assert changes == {"inserted": [], "updated": [], "deleted": ["a"], "moved": []}
+
+
+def test_move():
+    content, changes, text_changed = apply_ops(blocks("a", "b", "c"), [
+        {"op": "move", "id": "c", "after": None},
+        {"op": "move", "id": "a", "after": "b"},
+    ])
+    assert ids(content) == ["c", "b", "a"]
+    assert changes["moved"] == ["c", "a"]
+    assert text_changed
+
+
+def test_moving_an_inserted_block_reports_the_insert():
+    content, changes, _ = apply_ops(blocks("a", "b"), [
+        {"op": "insert", "block": {"id": "c", "value": "New"}, "after": None},
+        {"op": "move", "id": "c", "after": "b"},
+    ])
+    assert ids(content) == ["a", "b", "c"]
+    assert changes["inserted"] == ["c"]
+    assert changes["moved"] == []
+
+
+def test_style_update_doesnt_change_text():
+    content, changes, text_changed = apply_ops(blocks("a"), [
+        {"op": "update", "id": "a", "block": {"style": {"align": "center"}}},
+        {"op": "update", "id": "a", "block": {"value": "Text of a"}},
+    ])
+    assert content[0]["style"] == {"align": "center"}
+    assert changes["updated"] == ["a"]
+    assert not text_changed
+
+
+def test_original_content_is_untouched():
+    original = blocks("a")
+    apply_ops(original, [{"op": "update", "id": "a", "block": {"value": "Changed"}}])
+    assert original == blocks("a")
+
+
+@pytest.mark.parametrize("op", [
+    {"op": "delete", "id": "missing"},
+    {"op": "move", "id": "a", "after": "missing"},
+    {"op": "insert", "block": {"id": "a"}},
+    {"op": "insert", "block": {"value": "No id"}},
+    {"op": "update", "id": "a", "block": {"id": "b"}},
+    {"op": "replace", "id": "a"},
+])
+def test_invalid_ops(op):
+    with pytest.raises(PatchError):
+        apply_ops(blocks("a"), [op])
+
+
+def test_patch_conflicts_on_stale_base_revision(client):
+    id = client.post("/notes", json=make_note(1, 2), headers=HEADERS).get_json()["id"]
+    ops = [{"op": "update", "id": "block-0", "block": {"value": "First"}}]
+
+    response = client.patch(f"/notes/{id}", json={"baseRevision": 1, "ops": ops}, headers=HEADERS)
+    assert response.status_code == 200
+    assert response.get_json()["revision"] == 2
+
+    # A second edit made against revision 1 must not overwrite the first
+    ops = [{"op": "update", "id": "block-0", "block": {"value": "Second"}}]
+    response = client.patch(f"/notes/{id}", json={"baseRevision": 1, "ops": ops}, headers=HEADERS)
+    assert response.status_code == 409
+    assert response.get_json()["revision"] == 2
+
+    note = client.get(f"/notes/{id}", headers=HEADERS).get_json()["data"]
+    assert note["content"][0]["value"] == "First"
+    assert note["revision"] == 2
+
+
+def test_patch_rejects_invalid_ops(client):
+    id = client.post("/notes", json=make_note(1, 2), headers=HEADERS).get_json()["id"]
+    response = client.patch(f"/notes/{id}", json={"baseRevision": 1, "ops": [{"op": "delete", "id": "missing"}]}, headers=HEADERS)
+    assert response.status_code == 400
+    assert client.get(f"/notes/{id}", headers=HEADERS).get_json()["data"]["revision"] == 1
+
+
+def test_patch_needs_edit_permission(client):
+    note = make_note(1, 2)
+    note["permissions"]["view"] = ["viewer"]
+    note["permissions"]["edit"] = ["editor"]
+    id = client.post("/notes", json=note, headers=HEADERS).get_json()["id"]
+    ops = [{"op": "update", "id": "block-0", "block": {"value": "Edited"}}]
+
+    response = client.patch(f"/notes/{id}", json={"baseRevision": 1, "ops": ops}, headers={"Authorization": "Bearer token-viewer"})
+    assert response.get_json() == {"success": False, "error": "No permission"}
+    response = client.patch(f"/notes/{id}", json={"baseRevision": 1, "ops": ops}, headers={"Authorization": "Bearer token-editor"})
+    assert response.get_json()["revision"] == 2
@@ -0,0 +1,72 @@
+import numpy as np
+
+from benchmarks.e2e import make_note, HEADERS
+from benchmarks.fakes import FakeEmbeddings, LatencyBackend
+from services import clients
+from services.clients import get_note_ref
+from services.embedding_cache import CachedEmbeddings
+from services.indexing_queue import flush
+from services.rerank import mmr, select_chunks, lexical_scores
+from services.vectorstore_service import retrieve_similar_notes, retrieve_across_notes
+
+
+class RecordingBackend(LatencyBackend):
+    """Records the vector store calls made during retrieval"""
+
+    def __init__(self, backend):
+        super().__init__(backend)
+        self.calls = []
+
+    def query(self, namespace, vector, top_k, filter=None, include_values=False):
+        self.calls.append(("query", include_values))
+        return super().query(namespace, vector, top_k, filter=filter, include_values=include_values)
+
+    def fetch(self, namespace, ids):
+        self.calls.append(("fetch", sorted(ids)))
+        return super().fetch(namespace, ids)
+
+
+def indexed_note(client):
+    id = client.post("/notes", json=make_note(1, 30), headers=HEADERS).get_json()["id"]
+    flush()
+    backend = RecordingBackend(clients.get_vector_backend())
+    clients.set_client("vectors", backend)
+    return {**get_note_ref().document(id).get().to_dict(), "id": id}, backend
+
+
+def test_candidate_vectors_come_from_the_embedding_cache(client):
+    note, backend = indexed_note(client)
+    assert retrieve_similar_notes("eigenvalues", note)
+    assert retrieve_across_notes("eigenvalues", [note])[0]
+    assert backend.calls == [("query", False), ("query", False)]
+
+
+def test_vectors_missing_from_the_cache_are_fetched(client):
+    note, backend = indexed_note(client)
+    # As on an instance that didn't index the note
+    clients.set_client("embeddings", CachedEmbeddings(FakeEmbeddings(), "fake"))
+
+    assert retrieve_similar_notes("eigenvalues", note)
+    assert backend.calls[0] == ("query", False)
+    assert backend.calls[1][0] == "fetch" and backend.calls[1][1]
+
+
+def test_mmr_skips_near_duplicates():
+    vectors = [[1, 0, 0], [0.99, 0.01, 0], [0, 1, 0]]
+    relevance = np.array([0.9, 0.89, 0.7], dtype=np.float32)
+    assert mmr(vectors, relevance, 2, lambda_=0.5) == [0, 2]
+    assert mmr(vectors, relevance, 2, lambda_=1) == [0, 1]
+
+
+def test_lexical_scores_favour_matching_words():
+    scores = lexical_scores("eigenvalues", ["about eigenvalues", "about matrices"])
+    assert scores[0] > 0 == scores[1]
+
+
+def test_select_chunks_ranks_by_relevance_without_vectors():
+    matches = [
+        {"id": "a", "score": 0.5, "metadata": {"text": "matrices"}, "values": None},
+        {"id": "b", "score": 0.6, "metadata": {"text": "determinants"}, "values": None},
+        {"id": "c", "score": 0.9, "metadata": {}},
+    ]
+    assert [match["id"] for match in select_chunks("eigenvalues", matches, 5)] == ["b", "a"]
@@ -0,0 +1,187 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from benchmarks.e2e import make_note, HEADERS
+from services import search_index
+from services.clients import get_note_ref
+from services.text_processing import tokenize
+
+
+def note(id, title, text="", owner="alice", viewers=(), revision=1):
+    return {
+        "id": id,
+        "title": title,
+        "description": "",
+        "owner": owner,
+        "permissions": {"view": list(viewers), "edit": [], "names": {}, "global": None},
+        "content": [{"id": "b0", "value": text}],
+        "revision": revision,
+    }
+
+
+@pytest.fixture
+def index(store):
+    # Firestore starts empty, so loading adds nothing
+    return search_index
+
+
+def found(index, query, uid="alice", **kwargs):
+    page, _ = index.search(query, uid, **kwargs)
+    return [result["id"] for result in page]
+
+
+def test_ranks_title_matches_first(index):
+    index.index_note(note("body", "Lecture", "eigenvalues and eigenvectors"))
+    index.index_note(note("title", "Eigenvalues", "a lecture"))
+    assert found(index, "eigenvalues") == ["title", "body"]
+
+
+def test_scoped_to_accessible_notes(index):
+    index.index_note(note("mine", "Matrices"))
+    index.index_note(note("shared", "Matrices", owner="bob", viewers=["alice"]))
+    index.index_note(note("private", "Matrices", owner="bob"))
+    assert sorted(found(index, "matrices")) == ["mine", "shared"]
+    assert sorted(found(index, "matrices", uid="bob")) == ["private", "shared"]
+
+
+def test_sharing_updates_access(index):
+    index.index_note(note("n", "Matrices", owner="bob"))
+    assert found(index, "matrices") == []
+    index.update_access("n", {"view": ["alice"]}, ["alice", "bob"])
+    assert found(index, "matrices") == ["n"]
+    index.update_access("n", {"view": []}, ["bob"])
+    assert found(index, "matrices") == []
+
+
+def test_last_term_matches_as_prefix(index):
+    index.index_note(note("n", "Linear algebra", "eigenvalues of matrices"))
+    assert found(index, "linear eig") == ["n"]
+    # Only the last term is a prefix
+    assert found(index, "lin algebra") == []
+    # Single letters are too short to expand
+    assert found(index, "linear e") == []
+
+
+def test_every_term_must_match(index):
+    index.index_note(note("both", "Eigenvalues", "of matrices"))
+    index.index_note(note("one", "Eigenvalues"))
+    assert found(index, "eigenvalues matrices") == ["both"]
+
+
+def test_paging(index):
+    for i in range(25):
+        index.index_note(note(f"n{i:02}", "Lecture"))
+    first, total = index.search("lecture", "alice", limit=10)
+    last, _ = index.search("lecture", "alice", limit=10, offset=20)
+    assert total == 25
+    assert len(first) == 10 and len(last) == 5
+    pages = [index.search("lecture", "alice", limit=10, offset=offset)[0] for offset in (0, 10, 20)]
+    assert sorted(result["id"] for page in pages for result in page) == [f"n{i:02}" for i in range(25)]
+
+
+def test_reindexing_replaces_terms_and_ignores_older_revisions(index):
+    index.index_note(note("n", "Determinants", revision=2))
+    index.index_note(note("n", "Eigenvalues", revision=1))
+    assert found(index, "determinants") == ["n"]
+    index.index_note(note("n", "Eigenvalues", revision=3))
+    assert found(index, "determinants") == []
+    assert found(index, "eigenvalues") == ["n"]
+
+
+def test_removed_notes_arent_found(index):
+    index.index_note(note("n", "Eigenvalues"))
+    index.remove_note("n")
+    assert found(index, "eigenvalues") == []
+    assert found(index, "eig") == []
+
+
+def test_loads_notes_from_firestore(store):
+    get_note_ref().document("n").set(note("n", "Eigenvalues"))
+    assert found(search_index, "eigenvalues") == ["n"]
+
+
+def test_load_keeps_edits_and_removals_made_meanwhile(store):
+    get_note_ref().document("edited").set(note("edited", "Determinants"))
+    get_note_ref().document("removed").set(note("removed", "Determinants"))
+    # Saved and removed through this process before the load reads them
+    search_index.index_note(note("edited", "Eigenvalues", revision=2))
+    search_index.remove_note("removed")
+
+    assert found(search_index, "eigenvalues") == ["edited"]
+    assert found(search_index, "determinants") == []
+
+
+@pytest.fixture
+def saved_elsewhere(store, monkeypatch):
+    """Saves notes to Firestore directly, as another process would, and records what the index reads"""
+    monkeypatch.setattr(search_index, "SEARCH_INDEX_SYNC_SECONDS", 0)
+    indexed = []
+    index_note = search_index.index_note
+
+    def recording(note_data):
+        indexed.append(note_data["id"])
+        index_note(note_data)
+
+    monkeypatch.setattr(search_index, "index_note", recording)
+
+    def save(data, **changes):
+        data = {**data, "updatedAt": datetime.now(timezone.utc), **changes}
+        get_note_ref().document(data["id"]).set(data)
+        return data
+    save.indexed = indexed
+    return save
+
+
+def test_catches_up_with_notes_saved_elsewhere(saved_elsewhere):
+    saved_elsewhere(note("old", "Determinants"))
+    assert found(search_index, "determinants") == ["old"]
+
+    saved_elsewhere.indexed.clear()
+    saved_elsewhere(note("new", "Eigenvalues"))
+    saved_elsewhere(note("old", "Matrices", revision=2))
+    assert found(search_index, "eigenvalues") == ["new"]
+    assert found(search_index, "determinants") == []
+    assert found(search_index, "matrices") == ["old"]
+    # Only the changed notes were read again
+    assert sorted(set(saved_elsewhere.indexed)) == ["new", "old"]
+
+
+def test_catches_up_with_notes_shared_elsewhere(saved_elsewhere):
+    private = saved_elsewhere(note("n", "Eigenvalues", owner="bob"))
+    assert found(search_index, "eigenvalues") == []
+
+    private["permissions"]["view"] = ["alice"]
+    saved_elsewhere(private, updatedAt=private["updatedAt"], access=["alice", "bob"], accessUpdatedAt=datetime.now(timezone.utc))
+    assert found(search_index, "eigenvalues") == ["n"]
+
+
+def test_check_access_follows_firestore(store, index):
+    for id in ("kept", "revoked", "deleted"):
+        shared = note(id, "Matrices", owner="bob", viewers=["alice"])
+        shared["access"] = ["alice", "bob"]
+        get_note_ref().document(id).set(shared)
+        index.index_note(shared)
+
+    # Changed by another process, which doesn't update this index
+    get_note_ref().document("revoked").update({"permissions.view": [], "access": ["bob"]})
+    get_note_ref().document("deleted").delete()
+
+    page, _ = index.search("matrices", "alice")
+    assert [result["id"] for result in index.check_access(page, "alice")] == ["kept"]
+    # The index was corrected too
+    assert found(index, "matrices") == ["kept"]
+    assert found(index, "matrices", uid="bob") == ["kept", "revoked"]
+
+
+def test_notes_query_rechecks_access(client):
+    id = client.post("/notes", json=make_note(1, 1), headers=HEADERS).get_json()["id"]
+    assert [result["id"] for result in client.get("/notes?q=lecture", headers=HEADERS).get_json()["results"]] == [id]
+
+    get_note_ref().document(id).update({"owner": "bob", "access": ["bob"]})
+    assert client.get("/notes?q=lecture", headers=HEADERS).get_json()["results"] == []
+
+
+def test_tokenize():
+    assert tokenize("Eigen-values, of A_2!") == ["eigen", "values", "of", "a_2"]
+    assert tokenize(None) == []
@@ -0,0 +1,74 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.singleflight import single_flight, flight_key
+
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+    started = threading.Event()
+
+    def slow():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "answer"
+
+    with ThreadPoolExecutor(8) as executor:
+        leader = executor.submit(single_flight, "key", slow)
+        started.wait()
+        followers = [executor.submit(single_flight, "key", slow) for _ in range(7)]
+        results = [leader.result()] + [follower.result() for follower in followers]
+
+    assert results == ["answer"] * 8
+    assert len(calls) == 1
+
+
+def test_followers_share_the_error():
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("upstream failed")
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(single_flight, "failing", failing)
+        started.wait()
+        follower = executor.submit(single_flight, "failing", failing)
+        for future in (leader, follower):
+            with pytest.raises(RuntimeError, match="upstream failed"):
+                future.result()
+
+
+def test_sequential_calls_run_again():
+    calls = []
+    for _ in range(2):
+        single_flight("key", lambda: calls.append(1))
+    assert len(calls) == 2
+
+
+def test_different_keys_dont_wait_for_each_other():
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocked():
+        started.set()
+        release.wait(5)
+        return "blocked"
+
+    with ThreadPoolExecutor(2) as executor:
+        first = executor.submit(single_flight, "first", blocked)
+        started.wait()
+        assert single_flight("second", lambda: "second") == "second"
+        release.set()
+        assert first.result() == "blocked"
+
+
+def test_flight_key_ignores_case_and_whitespace():
+    assert flight_key("search", 1, "What is  an Eigenvalue?") == flight_key("search", 1, " what is an eigenvalue? ")
+    assert flight_key("search", 1, "question") != flight_key("search", 2, "question")
+    assert flight_key("search", 1, "question") != flight_key("chat", 1, "question")
@@ -0,0 +1,49 @@
+from services.text_processing import chunk_notes
+from services.vectorstore_service import chunk_id
+
+
+def texts(chunks):
+    return [chunk.page_content for chunk in chunks]
+
+
+def test_packs_adjacent_blocks():
+    chunks = list(chunk_notes(["one", "two", "three"], ["a", "b", "c"], chunk_size=100))
+    assert texts(chunks) == ["one\ntwo\nthree"]
+    assert chunks[0].metadata == {"block_start": "a", "block_end": "c"}
+
+
+def test_chunks_stay_under_the_size():
+    blocks = [f"Block {i} " * 5 for i in range(40)]
+    chunks = list(chunk_notes(blocks, chunk_size=200))
+    assert len(chunks) > 1
+    assert all(len(chunk.page_content) <= 200 for chunk in chunks)
+    # Every block appears exactly once, in order
+    assert "\n".join(texts(chunks)) == "\n".join(blocks)
+
+
+def test_splits_only_oversized_blocks():
+    long = "word " * 100
+    chunks = list(chunk_notes(["short", long, "tail"], ["a", "b", "c"], chunk_size=100, overlap=10))
+    assert chunks[0].page_content == "short"
+    assert chunks[-1].page_content == "tail"
+    pieces = chunks[1:-1]
+    assert len(pieces) > 1
+    assert all(piece.metadata == {"block_start": "b", "block_end": "b"} for piece in pieces)
+    assert all(len(piece.page_content) <= 100 for piece in pieces)
+
+
+def test_editing_one_block_keeps_most_chunk_ids():
+    blocks = [f"Point {i}: " + "eigenvalues " * 8 for i in range(60)]
+    block_ids = [f"block-{i}" for i in range(60)]
+    before = {chunk_id(chunk) for chunk in chunk_notes(blocks, block_ids, chunk_size=400)}
+
+    blocks[30] = "Edited"
+    after = {chunk_id(chunk) for chunk in chunk_notes(blocks, block_ids, chunk_size=400)}
+
+    assert len(after - before) <= 3
+    assert len(before & after) >= len(before) - 3
+
+
+def test_empty_note_has_no_chunks():
+    assert list(chunk_notes([])) == []
+
@@ -0,0 +1,72 @@
+import pytest
+
+from services import upstream
+from services.upstream import backoff, call_upstream, is_retryable
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (StatusError(429), True),
+    (StatusError(503), True),
+    (StatusError(400), False),
+    (StatusError(401), False),
+    (ConnectionResetError(), True),
+    (TimeoutError(), True),
+    (APIConnectionError(), True),
+    (ValueError("bad input"), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) == retryable
+
+
+def test_backoff_is_capped_and_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(upstream, "UPSTREAM_BACKOFF_BASE", 0.5)
+    monkeypatch.setattr(upstream, "UPSTREAM_BACKOFF_CAP", 4)
+    assert all(0 <= backoff(attempt) <= 4 for attempt in range(10))
+    assert backoff(0, StatusError(429, {"retry-after": "3"})) >= 3
+    assert backoff(0, StatusError(429, {"retry-after": "60"})) == 4
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    slept = []
+    monkeypatch.setattr(upstream.time, "sleep", slept.append)
+    monkeypatch.setattr(upstream, "UPSTREAM_MAX_RETRIES", 2)
+    return slept
+
+
+def failing(*errors):
+    errors = list(errors)
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+    return call
+
+
+def test_retries_retryable_errors(delays):
+    assert call_upstream(failing(StatusError(503), ConnectionResetError())) == "ok"
+    assert len(delays) == 2
+
+
+def test_gives_up_after_max_retries(delays):
+    with pytest.raises(StatusError):
+        call_upstream(failing(StatusError(503), StatusError(503), StatusError(503)))
+    assert len(delays) == 2
+
+
+def test_doesnt_retry_client_errors(delays):
+    with pytest.raises(StatusError):
+        call_upstream(failing(StatusError(400)))
+    assert delays == []
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+
+import pytest
+from firebase_admin import auth
+
+from benchmarks.fakes import fake_get_users
+from services import users
+from services.users import BATCH_SIZE, resolve_users
+
+
+@pytest.fixture
+def lookups(store, monkeypatch):
+    """Records the identifiers sent in each auth.get_users call, with an empty cache"""
+    calls = []
+
+    def get_users(identifiers):
+        calls.append(identifiers)
+        return fake_get_users(identifiers)
+
+    monkeypatch.setattr(auth, "get_users", get_users)
+    monkeypatch.setattr(users, "_cache", OrderedDict())
+    return calls
+
+
+def test_resolves_emails_and_uids(lookups):
+    assert resolve_users(["alice@example.com", "bob", "missing@example.com", "not an email@"]) == {
+        "alice@example.com": ("alice", "Alice"),
+        "bob": ("bob", "Bob"),
+    }
+    assert len(lookups) == 1
+
+
+def test_looks_up_in_batches(lookups):
+    emails = [f"user{i}@example.com" for i in range(BATCH_SIZE * 2 + 1)]
+    assert len(resolve_users(emails)) == len(emails)
+    assert sorted(len(batch) for batch in lookups) == [1, BATCH_SIZE, BATCH_SIZE]
+
+
+def test_caches_users_by_email_and_uid(lookups, monkeypatch):
+    resolve_users(["Alice@Example.com"])
+    # Emails are case-insensitive, and the uid was cached with the email
+    assert resolve_users(["alice@example.com", "alice"]) == {
+        "alice@example.com": ("alice", "Alice"),
+        "alice": ("alice", "Alice"),
+    }
+    assert len(lookups) == 1
+
+    now = users.time.monotonic() + users.USER_CACHE_TTL + 1
+    monkeypatch.setattr(users.time, "monotonic", lambda: now)
+    resolve_users(["alice"])
+    assert len(lookups) == 2
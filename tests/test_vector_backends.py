@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+
+from services.vector_backends import LocalBackend
+
+
+def record(note_id, chunk, values):
+    return {"id": f"{note_id}/{chunk}", "values": values, "metadata": {"note_id": note_id, "text": chunk}}
+
+
+@pytest.fixture(params=[False, True], ids=["memory", "disk"])
+def backend(request, tmp_path):
+    return LocalBackend(str(tmp_path) if request.param else None)
+
+
+@pytest.fixture
+def writes(backend, monkeypatch):
+    """Records the partition of every segment the backend writes"""
+    partitions = []
+    write = backend._write
+
+    def recording(namespace, loaded, partition, *args):
+        partitions.append(partition)
+        return write(namespace, loaded, partition, *args)
+
+    monkeypatch.setattr(backend, "_write", recording)
+    return partitions
+
+
+def test_writes_only_the_notes_segment(backend, writes):
+    backend.upsert("all", [record("a", "1", [1, 0]), record("b", "1", [0, 1])])
+    assert sorted(writes) == ["a", "b"]
+
+    writes.clear()
+    backend.upsert("all", [record("a", "2", [1, 1])])
+    backend.delete("all", ["a/1"])
+    assert writes == ["a", "a"]
+    assert backend.list_ids("all") == {"a/2", "b/1"}
+    assert backend.list_ids("all", prefix="b/") == {"b/1"}
+
+
+def test_filtered_queries_only_scan_the_notes_named(backend, monkeypatch):
+    backend.upsert("all", [record("a", "1", [1, 0]), record("b", "1", [0.9, 0.1]), record("c", "1", [0, 1])])
+    scanned = []
+    segments = backend._segments
+
+    def recording(loaded, filter):
+        found = segments(loaded, filter)
+        scanned.extend(found)
+        return found
+
+    monkeypatch.setattr(backend, "_segments", recording)
+
+    matches = backend.query("all", [1, 0], 5, filter={"note_id": {"$in": ["b", "c"]}})
+    assert [match["id"] for match in matches] == ["b/1", "c/1"]
+    assert sum(len(segment.ids) for segment in scanned) == 2
+    assert [match["id"] for match in backend.query("all", [1, 0], 2)] == ["a/1", "b/1"]
+
+
+def test_moves_records_between_partitions(backend):
+    backend.upsert("all", [{"id": "x", "values": [1, 0]}])
+    backend.upsert("all", [{"id": "x", "values": [0, 1], "metadata": {"note_id": "a"}}])
+    assert backend.fetch("all", ["x"]) == {"x": [0.0, 1.0]}
+    assert backend.describe_stats()["total_vector_count"] == 1
+    assert [match["id"] for match in backend.query("all", [0, 1], 5, filter={"note_id": "a"})] == ["x"]
+
+
+def test_reloads_segments_from_disk(tmp_path):
+    backend = LocalBackend(str(tmp_path))
+    backend.upsert("all", [record("a", "1", [3, 4]), record("b", "1", [0, 1])])
+    backend.upsert("note", [{"id": "1", "values": [1, 0]}])
+    backend.delete("all", ["b/1"])
+
+    reloaded = LocalBackend(str(tmp_path))
+    assert reloaded.list_ids("all") == {"a/1"}
+    assert np.allclose(reloaded.fetch("all", ["a/1"])["a/1"], [0.6, 0.8])
+    assert reloaded.describe_stats()["namespaces"] == {"all": {"vector_count": 1}, "note": {"vector_count": 1}}
+    # The emptied segment's files are gone
+    assert sum(len(files) for _, _, files in os.walk(tmp_path)) == 4
+
+    reloaded.delete("all")
+    assert reloaded.list_ids("all") == set()
+    assert LocalBackend(str(tmp_path)).describe_stats()["total_vector_count"] == 1
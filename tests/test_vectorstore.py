@@ -0,0 +1,123 @@
+import pytest
+
+from benchmarks.e2e import make_note, HEADERS
+from services.clients import get_embeddings, get_note_ref
+from services import indexing_queue
+from services.indexing_queue import flush
+from services.rag import rag_store
+from services.text_processing import chunk_notes, note_blocks
+from services.vectorstore_service import SHARED_NAMESPACE, chunk_id, commit_revision, get_backend, get_note_vector_ids, retrieve_similar_notes
+
+
+@pytest.fixture
+def upserts(store, monkeypatch):
+    """Records the IDs upserted into each namespace"""
+    backend = get_backend()
+    upsert = backend.upsert
+    recorded = {}
+
+    def recording(namespace, records):
+        recorded.setdefault(namespace, []).extend(record["id"] for record in records)
+        return upsert(namespace, records)
+
+    monkeypatch.setattr(backend, "upsert", recording)
+    return recorded
+
+
+def save(note, revision):
+    note = {**note, "id": "note", "revision": revision}
+    get_note_ref().document("note").set(note)
+    assert rag_store(note)
+    return note
+
+
+def long_note():
+    # Enough blocks for several chunks
+    return make_note(1, 40)
+
+
+def test_saving_unchanged_chunks_embeds_nothing(upserts):
+    note = long_note()
+    save(note, 1)
+    assert len(upserts["note"]) > 3
+    upserts.clear()
+
+    save(note, 2)
+    assert upserts == {}
+
+
+def test_editing_a_block_only_replaces_its_chunks(upserts):
+    note = long_note()
+    save(note, 1)
+    before = get_note_vector_ids("note")
+    upserts.clear()
+
+    note["content"][20]["value"] = "Edited"
+    save(note, 2)
+    after = get_note_vector_ids("note")
+
+    # Only new chunks are embedded and stored, the rest keep their vectors
+    assert set(upserts["note"]) == after - before
+    assert before & after
+    # The replaced chunks are deleted, from the shared namespace too
+    assert after == {chunk_id(chunk) for chunk in chunk_notes(*note_blocks(note))}
+    assert {id.split("/", 1)[1] for id in get_backend().list_ids(SHARED_NAMESPACE, prefix="note/")} == after
+
+
+def test_note_blocks_skips_empty_blocks():
+    note = {"content": [{"id": "a", "value": "Text"}, {"id": "b", "value": "  "}, {"value": "No id"}]}
+    assert note_blocks(note) == (["Text", "No id"], ["a", "1"])
+
+
+def one_block_note(text):
+    note = make_note(1, 1)
+    note["content"][0]["value"] = text
+    return note
+
+
+def test_an_older_revision_indexed_late_stays_hidden(store):
+    # As when two instances index the same note and the older one finishes last
+    new = save(one_block_note("NEW revision six text"), 6)
+    assert rag_store({**one_block_note("OLD revision five text"), "id": "note", "revision": 5})
+
+    note = get_note_ref().document("note").get().to_dict()
+    assert note["indexedRevision"] == 6
+    assert retrieve_similar_notes("revision text", {**note, "id": "note"}) == "NEW revision six text"
+    # Its vectors are removed too
+    assert get_note_vector_ids("note") == {chunk_id(chunk) for chunk in chunk_notes(*note_blocks(new))}
+    assert {id.split("/", 1)[1] for id in get_backend().list_ids(SHARED_NAMESPACE, prefix="note/")} == get_note_vector_ids("note")
+
+
+def test_commit_revision(store):
+    get_note_ref().document("note").set({"revision": 3})
+    assert commit_revision("note", 2, ["a"])
+    assert commit_revision("note", 3, ["b"])
+    assert commit_revision("note", 2, ["c"]) is False
+    assert commit_revision("missing", 1, []) is None
+    note = get_note_ref().document("note").get().to_dict()
+    assert note["indexedRevision"] == 3 and note["retiredChunks"] == ["b"]
+
+
+def test_queries_skip_revisions_that_arent_committed(store):
+    save(one_block_note("First draft"), 1)
+    # Stored by an indexer that hasn't committed revision 2 yet
+    vector = get_embeddings().embed_documents(["Second draft"])[0]
+    get_backend().upsert("note", [{"id": "next", "values": vector, "metadata": {"text": "Second draft", "chunk_id": "next", "revision": 2}}])
+
+    note = {**get_note_ref().document("note").get().to_dict(), "id": "note"}
+    assert retrieve_similar_notes("Second draft", note) == "First draft"
+
+
+def test_index_fields_are_only_set_by_the_indexer(client, monkeypatch):
+    note = make_note(1, 1)
+    note["indexedRevision"] = 99
+    id = client.post("/notes", json=note, headers=HEADERS).get_json()["id"]
+    flush()
+    assert get_note_ref().document(id).get().to_dict()["indexedRevision"] == 1
+
+    # Keep the edit queued, so it isn't indexed yet
+    monkeypatch.setattr(indexing_queue, "INDEX_DEBOUNCE_SECONDS", 60)
+    note.update(id=id, indexedRevision=99, retiredChunks=["x"])
+    client.put(f"/notes/{id}", json=note, headers=HEADERS)
+    stored = get_note_ref().document(id).get().to_dict()
+    assert (stored["revision"], stored["indexedRevision"], stored["retiredChunks"]) == (2, 1, [])